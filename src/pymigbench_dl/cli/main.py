@@ -8,9 +8,12 @@ of target commits that have exactly one parent.
 import os
 import argparse
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 from ..downloader import PyMigBenchDownloader
+from ..loader import DEFAULT_PARSE_CACHE_DIR, PyMigBenchLoader
 from ..const.git import DEFAULT_GT_PATCH_BRANCH_NAME, DEFAULT_PRE_MIG_BRANCH_NAME
 
 def build_parser() -> argparse.ArgumentParser:
@@ -24,8 +27,16 @@ def build_parser() -> argparse.ArgumentParser:
     a.add_argument("--gt-patch-branch-name", default=DEFAULT_GT_PATCH_BRANCH_NAME)
     a.add_argument("--pre-mig-branch-name", default=DEFAULT_PRE_MIG_BRANCH_NAME)
     a.add_argument("--github-token")
-    a.add_argument("--max-workers", type=int, default=5)
-    a.add_argument("--rate-limit", type=float, default=1.0)
+    a.add_argument("--max-workers", type=int, default=5,
+                   help="Commits built concurrently. Workers mostly wait on the network, so this can exceed the CPU count")
+    a.add_argument("--rate-limit", type=float, default=1.0,
+                   help="Unused, requests are throttled from GitHub's rate-limit headers. Kept for compatibility")
+    a.add_argument("--git-mirror", action="store_true",
+                   help="Fetch snapshots into per-repo git mirrors instead of downloading a tarball per commit")
+    a.add_argument("--delta-snapshots", action="store_true",
+                   help="Rebuild migration snapshots from their parent's plus the few changed files instead of downloading their tarball")
+    a.add_argument("--parse-cache", nargs="?", const=str(DEFAULT_PARSE_CACHE_DIR), metavar="DIR",
+                   help=f"Cache the parsed YAML directory in DIR (default {DEFAULT_PARSE_CACHE_DIR}) and reuse it while no YAML changes")
 
     # download-single
     s = sub.add_parser("dl-single", help="Download a single commit from a YAML file")
@@ -34,6 +45,15 @@ def build_parser() -> argparse.ArgumentParser:
     s.add_argument("--gt-patch-branch-name", default=DEFAULT_GT_PATCH_BRANCH_NAME)
     s.add_argument("--pre-mig-branch-name", default=DEFAULT_PRE_MIG_BRANCH_NAME)
     s.add_argument("--github-token")
+    s.add_argument("--git-mirror", action="store_true",
+                   help="Fetch snapshots into per-repo git mirrors instead of downloading a tarball per commit")
+    s.add_argument("--delta-snapshots", action="store_true",
+                   help="Rebuild migration snapshots from their parent's plus the few changed files instead of downloading their tarball")
+
+    # convert-db
+    c = sub.add_parser("convert-db", help="Convert a YAML root into a JSON-lines file that dl-all reads instead")
+    c.add_argument("--yaml-root", required=True)
+    c.add_argument("--out", help="Output file (default: next to the YAML root, where dl-all looks for it)")
 
     p.add_argument("-v", "--verbose", action="count", default=0)
     p.add_argument("--log-file", help="Path to log file (logs to console only if not specified)")
@@ -50,22 +70,47 @@ def main():
         log_path = Path(args.log_file)
         log_path.parent.mkdir(parents=True, exist_ok=True)
         handlers.append(logging.FileHandler(args.log_file))
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    for handler in handlers:
+        handler.setFormatter(formatter)
 
-    logging.basicConfig(
-        level=lvl,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-        handlers=handlers
-    )
+    # Our format doesn't use these, so don't collect them for every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    # Worker threads only enqueue records; a single listener thread formats and writes them,
+    # so workers don't contend on the handlers' locks or block on console/file I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=lvl, handlers=[queue_handler])
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    try:
+        _run(args)
+    finally:
+        listener.stop()
+
+def _run(args: argparse.Namespace) -> None:
+    if args.cmd == "convert-db":
+        PyMigBenchLoader().convert_database(args.yaml_root, args.out)
+        return
 
     github_token = (getattr(args, "github_token", None) or os.getenv("GITHUB_TOKEN"))
     if not github_token:
         raise SystemExit("Error: GitHub token required. Set GITHUB_TOKEN or pass --github-token")
+    # Several comma-separated tokens spread requests over their rate limits
+    github_tokens = [t.strip() for t in github_token.split(",") if t.strip()]
 
     dl = PyMigBenchDownloader(
-        github_token=github_token,
+        github_token=github_tokens,
         output_dir=getattr(args, "output_dir", "repos"),
         max_workers=getattr(args, "max_workers", 5),
         rate_limit_delay=getattr(args, "rate_limit", 1.0),
+        use_git_mirror=args.git_mirror,
+        use_delta_snapshots=args.delta_snapshots,
+        parse_cache_dir=getattr(args, "parse_cache", None),
     )
 
     if args.cmd == "dl-all":
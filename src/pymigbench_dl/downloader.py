@@ -3,31 +3,82 @@ Main downloader coordinator for PyMigBench dataset.
 """
 
 import logging
+import tempfile
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import StrEnum
+from pathlib import Path
+from itertools import islice
+from typing import Iterable, Iterator, List
 
-from .utils.repo import create_pymigbench_type_repo
+from .utils.repo import (STAGING_DIR_PREFIX, BuildWorkspace, UnsupportedParentsError, create_pymigbench_type_repo,
+                         remove_stale_staging_dirs)
+from .utils.snapshots import SnapshotCache
+from .utils.ledger import TERMINAL_STATES, CommitState, DownloadLedger
+from .utils.git import is_valid_branch_name
 from .utils.paths import to_path
 from .const.git import DEFAULT_GT_PATCH_BRANCH_NAME, DEFAULT_PRE_MIG_BRANCH_NAME
 
 from .providers.github.models import CommitInfo
-from .providers.github.client import GitHubClient
+from .providers.github.client import GRAPHQL_BATCH_SIZE, GitHubClient
+from .providers.github.mirror import GitHubMirror
 from .loader import PyMigBenchLoader
 
+# Sidecar in the output dir holding ETags of GitHub commit lookups, so re-runs can use conditional requests
+ETAG_CACHE_FILE_NAME = ".github-etags.sqlite3"
+# Sidecar in the output dir recording the outcome of every commit, so resumed runs skip settled ones
+LEDGER_FILE_NAME = ".download-ledger.sqlite3"
+# Dir in the output dir holding the per-repo git mirrors, if enabled
+GIT_MIRROR_DIR_NAME = ".git-mirrors"
+
+
+class DownloadOutcome(StrEnum):
+    DOWNLOADED = "DOWNLOADED"
+    # Not a single-parent commit, in this run or a previous one
+    SKIPPED = "SKIPPED"
+    FAILED = "FAILED"
+
+
+def _batched(commits: Iterable[CommitInfo], n: int) -> Iterator[List[CommitInfo]]:
+    it = iter(commits)
+    while batch := list(islice(it, n)):
+        yield batch
 
 class PyMigBenchDownloader:
     """Main coordinator for downloading PyMigBench dataset."""
     
-    def __init__(self, github_token: str | None, output_dir: str = "repos", max_workers: int = 5, rate_limit_delay: float = 1.0):
-        if github_token == None or github_token == "":
+    def __init__(self, github_token: str | list[str] | None, output_dir: str = "repos", max_workers: int = 5, rate_limit_delay: float = 1.0,
+                 use_git_mirror: bool = False, use_delta_snapshots: bool = False, parse_cache_dir: str | None = None):
+        """
+        Args:
+            github_token: GitHub token used for all GitHub requests, or a list of tokens to rotate between
+            output_dir: Directory the repos are created in
+            max_workers: Number of commits processed concurrently by `download_all`
+            rate_limit_delay: Kept for backward compatibility; requests are throttled from GitHub's rate-limit headers
+            use_git_mirror: Fetch snapshots into per-repo git mirrors (kept under output_dir) instead of downloading
+                a tarball per commit. Commits of the same repo then share objects, so only what differs is transferred.
+            use_delta_snapshots: Without a git mirror, rebuild each migration snapshot from its parent's plus the few
+                files the migration changed, instead of downloading its tarball. Costs a request per changed file.
+            parse_cache_dir: Directory to cache parsed YAML directories in, reused by later runs for as long as the
+                YAMLs don't change. No caching if None.
+        """
+        if not github_token:
             raise RuntimeError("We require the user to provide a GitHub token to use pymigbench_dl to avoid being rate-limited by GitHub.")
         self.output_dir = to_path(output_dir, check_exists=False)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        remove_stale_staging_dirs(self.output_dir)
         self.max_workers = max_workers
         self.rate_limit_delay = rate_limit_delay
         
         # Initialize components
-        self.github_client = GitHubClient(github_token)
-        self.pymigbench_loader = PyMigBenchLoader()
+        # Each build streams its parent and migration snapshots concurrently
+        self.github_client = GitHubClient(github_token, pool_maxsize=2 * max_workers,
+                                          etag_cache_path=self.output_dir / ETAG_CACHE_FILE_NAME)
+        self.pymigbench_loader = PyMigBenchLoader(
+            cache_dir=to_path(parse_cache_dir) if parse_cache_dir is not None else None)
+        self.ledger = DownloadLedger(self.output_dir / LEDGER_FILE_NAME)
+        self.git_mirror = GitHubMirror(self.output_dir / GIT_MIRROR_DIR_NAME, self.github_client.github_token) if use_git_mirror else None
+        self.use_delta_snapshots = use_delta_snapshots
         
         # Setup logging to both file and console
         self.logger = logging.getLogger(__name__)
@@ -38,7 +89,14 @@ class PyMigBenchDownloader:
         final_dir = self.output_dir / mig_commit_info.folder_name
         return final_dir.exists()
 
-    def download_single_from_commit_info(self, commit_info: CommitInfo, gt_patch_branch_name: str, pre_mig_branch_name: str) -> bool:
+    def is_settled(self, mig_commit_info: CommitInfo) -> bool:
+        """Whether a previous run already classified this commit as permanently skipped."""
+        return self.ledger.get(mig_commit_info) in TERMINAL_STATES
+
+    def download_single_from_commit_info(self, commit_info: CommitInfo, gt_patch_branch_name: str, pre_mig_branch_name: str,
+                                         known_parents: tuple[int, str | None] | None = None,
+                                         parent_cache: SnapshotCache | None = None, parent: CommitInfo | None = None,
+                                         workspace: BuildWorkspace | None = None) -> DownloadOutcome:
         """
         Process a single commit: check parents, download if valid.
 
@@ -46,20 +104,58 @@ class PyMigBenchDownloader:
             commit_info: Information about the commit to process
             gt_patch_branch_name: Name of the branch for ground-truth patch
             pre_mig_branch_name: Name of the branch for pre-migration state
+            known_parents: (parent_count, first_parent_sha) if already looked up, queried from GitHub otherwise
+            parent_cache: Cache the parent snapshot is taken from, if the caller retained `parent` in it.
+                The parent is released once the commit is processed, whatever the outcome.
+            parent: The commit's parent, as retained in `parent_cache`
+            workspace: Staging roots and prefetch threads shared by the caller's pool of workers
 
         Returns:
-            True if processed successfully, False otherwise
+            DOWNLOADED if the commit is built (now or by a previous run), SKIPPED if it has no single parent,
+            FAILED otherwise
         """
         try:
+            state = self.ledger.get(commit_info)
+            if state in TERMINAL_STATES:
+                self.logger.info("Skipping %s because a previous run marked it %s", commit_info, state)
+                return DownloadOutcome.SKIPPED
             if self.has_downloaded(commit_info):
                 self.logger.info("Skipping %s because it's already downloaded", commit_info)
-                return True
-            create_pymigbench_type_repo(commit_info, self.output_dir, gt_patch_branch_name, self.github_client, pre_mig_branch_name)
-            return True
+                return DownloadOutcome.DOWNLOADED
+            parent_tree = parent_cache.get(parent) if parent_cache is not None and parent is not None else None
+            parent_sha = create_pymigbench_type_repo(commit_info, self.output_dir, gt_patch_branch_name, self.github_client,
+                                                     pre_mig_branch_name, known_parents=known_parents, mirror=self.git_mirror,
+                                                     parent_tree=parent_tree, use_delta=self.use_delta_snapshots,
+                                                     workspace=workspace)
+            self.ledger.put(commit_info, CommitState.DOWNLOADED, parent_sha)
+            return DownloadOutcome.DOWNLOADED
+        except UnsupportedParentsError as e:
+            self.logger.error("Skipping %s: %s", commit_info, e)
+            state = CommitState.SKIPPED_NO_PARENT if e.parent_count == 0 else CommitState.SKIPPED_MULTI_PARENT
+            self.ledger.put(commit_info, state)
+            return DownloadOutcome.SKIPPED
         except Exception as e:
-            self.logger.error(f"Failed to process repo {commit_info.repo} commit {commit_info.commit_sha}")
-            self.logger.error(f"Got error: {e}")
-            return False
+            self.logger.error("Failed to process repo %s commit %s", commit_info.repo, commit_info.commit_sha)
+            self.logger.error("Got error: %s", e)
+            self.ledger.put(commit_info, CommitState.FAILED)
+            return DownloadOutcome.FAILED
+        finally:
+            if parent_cache is not None and parent is not None:
+                parent_cache.release(parent)
+
+    @staticmethod
+    def _check_branch_names(gt_patch_branch_name: str, pre_mig_branch_name: str) -> None:
+        """Fail before any download rather than in every build."""
+        for name in (gt_patch_branch_name, pre_mig_branch_name):
+            if not is_valid_branch_name(name):
+                raise ValueError(f"Invalid git branch name {name!r}")
+        if gt_patch_branch_name == pre_mig_branch_name:
+            raise ValueError(f"The ground-truth and pre-migration branches can't have the same name {gt_patch_branch_name!r}")
+
+    @staticmethod
+    def _single_parent(commit: CommitInfo, known_parents: dict[tuple[str, str], tuple[int, str | None]]) -> CommitInfo | None:
+        parent_count, parent_sha = known_parents.get((commit.repo, commit.commit_sha), (0, None))
+        return CommitInfo(commit.repo, parent_sha) if parent_count == 1 and parent_sha else None
 
     def download_single(self, yaml_file_path: str, gt_patch_branch_name: str = DEFAULT_GT_PATCH_BRANCH_NAME, pre_mig_branch_name: str = DEFAULT_PRE_MIG_BRANCH_NAME) -> None:
         """
@@ -70,6 +166,7 @@ class PyMigBenchDownloader:
             gt_patch_branch_name: Name of the branch that is created using the snapshot at ground-truth patch (i.e. migration patch)
             pre_mig_branch_name: Name of the branch for pre-migration state
         """
+        self._check_branch_names(gt_patch_branch_name, pre_mig_branch_name)
         commit_info = self.pymigbench_loader.load_single_commit_from_yaml(yaml_file_path)
         self.download_single_from_commit_info(commit_info, gt_patch_branch_name, pre_mig_branch_name)
         
@@ -82,37 +179,82 @@ class PyMigBenchDownloader:
             gt_patch_branch_name: Name of the branch that is created using the snapshot at ground-truth patch (i.e. migration patch)
             pre_mig_branch_name: Name of the branch for pre-migration state
         """
-        commits = self.pymigbench_loader.load_all_commits_from_database(yaml_root_path)
+        commits = self.pymigbench_loader.iter_commits_from_database(yaml_root_path)
+        self.download_commits(commits, gt_patch_branch_name, pre_mig_branch_name)
+
+    def download_commits(self, commits: Iterable[CommitInfo], gt_patch_branch_name: str = DEFAULT_GT_PATCH_BRANCH_NAME,
+                         pre_mig_branch_name: str = DEFAULT_PRE_MIG_BRANCH_NAME) -> tuple[int, int, int]:
+        """
+        Download the given commits concurrently on `max_workers` threads. A failed commit is logged and recorded
+        in the ledger without aborting the others.
+
+        Args:
+            commits: Commits to download, consumed lazily (e.g. straight from the loader)
+            gt_patch_branch_name: Name of the branch that is created using the snapshot at ground-truth patch (i.e. migration patch)
+            pre_mig_branch_name: Name of the branch for pre-migration state
+
+        Returns:
+            (successful, skipped, failed) counts, skipped ones being commits without a single parent
+        """
+        self._check_branch_names(gt_patch_branch_name, pre_mig_branch_name)
+        self.logger.info("Starting download using %d workers", self.max_workers)
 
-        self.logger.info(f"Starting download of {len(commits)} commits using {self.max_workers} workers")
+        outcomes: Counter[DownloadOutcome] = Counter()
 
-        successful = 0
-        failed = 0
+        # Parent snapshots shared by several commits are downloaded once into this cache. It's a staging dir, so
+        # it's swept by remove_stale_staging_dirs if the run is killed
+        # The workers' staging roots and prefetch threads live as long as the pool, which is shut down first
+        with tempfile.TemporaryDirectory(dir=self.output_dir, prefix=f"{STAGING_DIR_PREFIX}parents__") as tmp, \
+                BuildWorkspace(self.output_dir, self.max_workers) as workspace, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            parent_cache = SnapshotCache(Path(tmp), self.git_mirror or self.github_client)
+            # Commits are consumed as the loader parses them, and each batch is submitted as soon as its parents
+            # are resolved (one GraphQL request per batch instead of one REST request per commit inside the
+            # workers), so downloads start while the rest of the dataset is still being parsed
+            future_to_commit = {}
+            # Several migrations can share a commit; it's only built once
+            seen: set[CommitInfo] = set()
+            duplicates = 0
+            for batch in _batched(commits, GRAPHQL_BATCH_SIZE):
+                unique = [c for c in dict.fromkeys(batch) if c not in seen]
+                duplicates += len(batch) - len(unique)
+                seen.update(unique)
+                batch = unique
+                pending = [c for c in batch if not self.has_downloaded(c) and not self.is_settled(c)]
+                known_parents = self.github_client.get_commit_parents_batch(pending)
+                self.logger.info("Resolved parents of %d/%d pending commits via GraphQL", len(known_parents), len(pending))
+                # Only parents shared with another commit of the batch, or with one still in flight, go through the cache;
+                # the others are extracted straight into their staging repo
+                parents = {c: self._single_parent(c, known_parents) for c in pending}
+                parent_counts = Counter(p for p in parents.values() if p is not None)
+                for commit in batch:
+                    parent = parents.get(commit)
+                    shared = False
+                    if parent is not None and (parent_counts[parent] > 1 or parent in parent_cache):
+                        parent_cache.retain(parent)
+                        shared = True
+                    future = executor.submit(self.download_single_from_commit_info, commit, gt_patch_branch_name,
+                                             pre_mig_branch_name, known_parents.get((commit.repo, commit.commit_sha)),
+                                             parent_cache if shared else None, parent, workspace)
+                    future_to_commit[future] = commit
+            self.logger.info("Queued all %d commits (%d duplicates skipped)", len(future_to_commit), duplicates)
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all jobs
-            future_to_commit = {
-                executor.submit(self.download_single_from_commit_info, commit, gt_patch_branch_name, pre_mig_branch_name): commit
-                for commit in commits
-            }
-            
             # Process completed jobs
             for future in as_completed(future_to_commit):
                 commit = future_to_commit[future]
                 try:
-                    success = future.result()
-                    if success:
-                        successful += 1
-                    else:
-                        failed += 1
+                    outcomes[future.result()] += 1
                 except Exception as e:
-                    self.logger.error(f"Exception processing {commit.repo}:{commit.commit_sha}: {e}")
-                    failed += 1
+                    self.logger.error("Exception processing %s:%s: %s", commit.repo, commit.commit_sha, e)
+                    outcomes[DownloadOutcome.FAILED] += 1
                 
                 # Progress update
-                total_processed = successful + failed
+                total_processed = outcomes.total()
                 if total_processed % 10 == 0:
-                    self.logger.info(f"Progress: {total_processed}/{len(commits)} processed "
-                                   f"({successful} successful, {failed} failed)")
+                    self.logger.info("Progress: %d/%d processed (%d successful, %d skipped, %d failed)",
+                                     total_processed, len(future_to_commit), outcomes[DownloadOutcome.DOWNLOADED],
+                                     outcomes[DownloadOutcome.SKIPPED], outcomes[DownloadOutcome.FAILED])
         
-        self.logger.info(f"Download complete: {successful} successful, {failed} failed")
+        counts = outcomes[DownloadOutcome.DOWNLOADED], outcomes[DownloadOutcome.SKIPPED], outcomes[DownloadOutcome.FAILED]
+        self.logger.info("Download complete: %d successful, %d skipped, %d failed", *counts)
+        return counts
@@ -2,65 +2,339 @@
 PyMigBench dataset loader using the official PyMigBench Python package.
 """
 
+import hashlib
+import json
 import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from pymigbench.migration import Migration
 import yaml
 
-from pymigbench.database import Database
 from pymigbench.parsers import parse_migration
 
+try:
+    # libyaml-backed loader, ~10x faster than the pure-Python one
+    from yaml import CUnsafeLoader as _YamlLoader
+    HAS_LIBYAML = True
+except ImportError:  # PyYAML built without libyaml
+    from yaml import UnsafeLoader as _YamlLoader  # type: ignore[assignment]
+    HAS_LIBYAML = False
+
+try:
+    # rapidyaml parses into a flat C++ node tree, so reading two top-level keys doesn't build the whole document
+    import ryml  # type: ignore[import-not-found]
+except ImportError:  # optional, install the `rapidyaml` extra
+    ryml = None  # type: ignore[assignment]
+
+try:
+    # ~5x faster than the json module on our one-object-per-line files
+    import orjson
+except ImportError:  # optional, install the `orjson` extra
+    orjson = None  # type: ignore[assignment]
 
 from .utils.paths import to_path
 from .providers.github.models import CommitInfo
 
+# Most YAML files per task sent to a parser process, so IPC overhead is amortized over many small files
+YAML_PARSE_CHUNK_SIZE = 64
+# Suffix of the converted database written next to a YAML dir by `convert_database`, e.g. repo-yamls.jsonl
+CONVERTED_DB_SUFFIX = ".jsonl"
+# Suggested location for the parse cache of YAML directories (see PyMigBenchLoader's `cache_dir`), one file per directory
+DEFAULT_PARSE_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "pymigbench_dl"
+
+# What the rapidyaml path accepts as is; anything else goes through PyYAML, which also reports malformed files
+_PLAIN_REPO_RE = re.compile(r"[\w.-]+/[\w.-]+")
+_PLAIN_SHA_RE = re.compile(r"[0-9a-f]{7,40}")
+
+
+def _iter_yaml_files(yaml_root: Path) -> Iterator[Path]:
+    """
+    Yield the `*.yaml` files directly under `yaml_root`, i.e. the files PyMigBench's `Database.load_from_dir` reads.
+
+    A single `os.scandir` pass gets file types from the directory listing itself, without a `stat` per entry.
+    """
+    with os.scandir(yaml_root) as it:
+        for entry in it:
+            if entry.name.endswith(".yaml") and entry.is_file():
+                yield Path(entry.path)
+
+def _list_yaml_files(yaml_root: Path) -> List[Path]:
+    """`_iter_yaml_files` as a list, raising FileNotFoundError with a clear message if `yaml_root` doesn't exist."""
+    try:
+        return list(_iter_yaml_files(yaml_root))
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"PyMigBench YAML directory not found: {yaml_root}") from e
+
+# _parse_mig_file function is copied from PyMigBench's source code,
+# except for using the libyaml loader when available, and handing it raw bytes (it detects the encoding itself)
+def _parse_mig_file(path: Path) -> Migration:
+    raw = yaml.load(path.read_bytes(), Loader=_YamlLoader)
+    migration = parse_migration(raw)
+    return migration
+
+def _read_commit_fast(data: bytes) -> Optional[Tuple[str, str]]:
+    """
+    Read the top-level `repo` and `commit` of a migration YAML with rapidyaml, or None if they're missing or
+    don't look like a plain "owner/name" and hex SHA.
+    """
+    tree = ryml.parse_in_arena(data)
+    root = tree.root_id()
+    if not tree.is_map(root):
+        return None
+    values = {}
+    for i in range(tree.num_children(root)):
+        node = tree.child(root, i)
+        if tree.is_keyval(node):
+            key = bytes(tree.key(node))
+            if key in (b"repo", b"commit"):
+                values[key] = bytes(tree.val(node)).decode()
+    repo, commit = values.get(b"repo", ""), values.get(b"commit", "")
+    if not (_PLAIN_REPO_RE.fullmatch(repo) and _PLAIN_SHA_RE.fullmatch(commit)):
+        return None
+    return repo, commit
+
+def _parse_commit(path: Path, fast: bool) -> Tuple[str, str]:
+    data = path.read_bytes()
+    if fast:
+        try:
+            commit = _read_commit_fast(data)
+        except Exception:  # rapidyaml's parse errors; PyYAML below reports them properly
+            commit = None
+        if commit is not None:
+            return commit
+    mig = parse_migration(yaml.load(data, Loader=_YamlLoader))
+    return mig.repo, mig.commit
+
+def _parse_commits(paths: List[Path], fast: bool = False) -> List[Tuple[str, str]]:
+    """
+    Parse migration YAML files into (repo, commit_sha) pairs. Runs in worker processes, hence module-level.
+
+    With `fast`, only `repo` and `commit` are read (with rapidyaml), so the rest of a migration isn't validated.
+    """
+    return [_parse_commit(path, fast) for path in paths]
+
+def converted_db_path(yaml_root: Path) -> Path:
+    """Where `convert_database` writes the converted database of `yaml_root` by default: next to it, not inside."""
+    yaml_root = yaml_root.resolve()
+    return yaml_root.with_name(yaml_root.name + CONVERTED_DB_SUFFIX)
+
+def _is_converted_db_fresh(db_path: Path, yaml_root: Path) -> bool:
+    """
+    Whether `db_path` exists and was written after the last change to `yaml_root`: no YAML file modified since,
+    and no file added or removed (which would update the directory's own mtime).
+    """
+    try:
+        built = db_path.stat().st_mtime_ns
+        if yaml_root.stat().st_mtime_ns > built:
+            return False
+    except FileNotFoundError:
+        return False
+    return all(path.stat().st_mtime_ns <= built for path in _iter_yaml_files(yaml_root))
+
+def _yaml_files_key(paths: List[Path]) -> str:
+    """Digest of the names, sizes and mtimes of `paths`, which changes whenever a file is added, removed or modified."""
+    h = hashlib.sha1()
+    for path in sorted(paths):
+        st = path.stat()
+        h.update(f"{path.name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def _loads(line: bytes) -> dict:
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+def _dumps(obj: dict) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
 
 class PyMigBenchLoader:
     """Loader for PyMigBench dataset using the official Python package."""
     
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, processes: bool = False, use_rapidyaml: bool = True,
+                 cache_dir: Optional[Path] = None):
+        """
+        Args:
+            max_workers: Threads (or processes) used to parse YAML files; defaults to the number of CPUs
+            processes: Parse in a process pool instead of a thread pool. Parsing holds the GIL, so threads mostly
+                overlap file reads, while processes parse in parallel. Under the spawn or forkserver start method
+                (macOS, Windows, Linux from Python 3.14), the calling script then needs an `if __name__ == "__main__":` guard.
+            use_rapidyaml: When loading a whole database and `rapidyaml` is installed, read only each migration's
+                repo and commit with it instead of parsing the full migration with PyYAML. Files it can't read
+                plainly still go through PyYAML.
+            cache_dir: Where the commits of a parsed YAML directory are saved, and read back on later loads for as
+                long as no YAML file is added, removed or modified, e.g. DEFAULT_PARSE_CACHE_DIR. No caching if None.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.processes = processes
+        self.use_rapidyaml = use_rapidyaml and ryml is not None
+        self.cache_dir = cache_dir
         self.logger = logging.getLogger(__name__)
+        self.logger.debug("Parsing YAML with %s (libyaml %s, rapidyaml %s)", _YamlLoader.__name__,
+                          "found" if HAS_LIBYAML else "missing", "used" if self.use_rapidyaml else "unused")
+        if not HAS_LIBYAML:
+            self.logger.warning("PyYAML was built without libyaml, so YAML parsing is ~10x slower. To fix it, run "
+                                "`apt install libyaml-dev && pip install --force-reinstall --no-binary pyyaml pyyaml`")
+
+    def iter_commits_from_database(self, yaml_root_path: str) -> Iterator[CommitInfo]:
+        """
+        Yield the commit of every migration in a PyMigBench YAML directory, as soon as it's parsed.
+
+        If the directory was converted with `convert_database` (to its default path) and hasn't changed since,
+        the converted database is read instead, which skips YAML parsing altogether. So is the parse cache in
+        `cache_dir`, if an earlier load of the same, unchanged directory filled it.
+        Otherwise files are parsed in chunks of up to YAML_PARSE_CHUNK_SIZE by a pool of `max_workers` threads (or processes),
+        so callers can start working on the first commits while the rest of the directory is still being parsed.
+
+        Args:
+            yaml_root_path: Path to the directory containing PyMigBench YAML files
+
+        Yields:
+            CommitInfo objects, in directory listing order
+        """
+        yaml_root = Path(yaml_root_path)
+        db_path = converted_db_path(yaml_root)
+        if _is_converted_db_fresh(db_path, yaml_root):
+            self.logger.info("Reading converted PyMigBench database %s", db_path)
+            yield from self.iter_commits_from_converted_database(db_path)
+        else:
+            yield from self._iter_commits_cached(yaml_root)
+
+    @staticmethod
+    def _cache_path(cache_dir: Path, yaml_root: Path) -> Path:
+        digest = hashlib.sha1(str(yaml_root.resolve()).encode()).hexdigest()
+        return cache_dir / f"{digest}.json"
+
+    def _iter_commits_cached(self, yaml_root: Path) -> Iterator[CommitInfo]:
+        """Commits of `yaml_root` from the parse cache if it's up to date, otherwise parsed and then cached."""
+        paths = _list_yaml_files(yaml_root)
+        if self.cache_dir is None:
+            yield from self._iter_commits_from_yaml(yaml_root, paths)
+            return
+
+        key = _yaml_files_key(paths)
+        cache_path = self._cache_path(self.cache_dir, yaml_root)
+        try:
+            cached = _loads(cache_path.read_bytes())
+        except (OSError, ValueError):
+            cached = None
+        if cached is not None and cached.get("key") == key:
+            self.logger.info("Read %d migrations of %s from parse cache %s", len(cached["commits"]), yaml_root, cache_path)
+            for repo, commit_sha in cached["commits"]:
+                yield CommitInfo(repo=repo, commit_sha=commit_sha)
+            return
+
+        commits = []
+        for commit in self._iter_commits_from_yaml(yaml_root, paths):
+            commits.append(commit)
+            yield commit
+        # Only reached if the caller consumed every commit, so the cache is never partial
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(_dumps({"key": key, "commits": [[c.repo, c.commit_sha] for c in commits]}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self.logger.warning("Couldn't write parse cache %s: %s", cache_path, e)
+
+    def iter_commits_from_converted_database(self, db_path: str | Path) -> Iterator[CommitInfo]:
+        """
+        Yield the commit of every migration in a database converted by `convert_database`.
+
+        Args:
+            db_path: Path to the converted database, one {"repo": ..., "commit": ...} JSON object per line
+
+        Yields:
+            CommitInfo objects, in the order they were converted
+        """
+        with open(db_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    mig = _loads(line)
+                    yield CommitInfo(repo=mig["repo"], commit_sha=mig["commit"])
+
+    def _iter_commits_from_yaml(self, yaml_root: Path, paths: Optional[List[Path]] = None) -> Iterator[CommitInfo]:
+        # Same files as Database.load_from_dir(yaml_root), but parsed with our (faster) YAML loader
+        if paths is None:
+            paths = _list_yaml_files(yaml_root)
+        self.logger.info("Found %d migrations in PyMigBench database %s", len(paths), yaml_root)
+        # Smaller chunks for small directories, so every worker gets a share
+        chunk_size = max(1, min(YAML_PARSE_CHUNK_SIZE, -(-len(paths) // self.max_workers)))
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+        # Not worth starting a pool for a single chunk or a single CPU
+        workers = min(self.max_workers, len(chunks))
+        executor_cls = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        executor = executor_cls(max_workers=workers) if workers > 1 else None
+        try:
+            parse = partial(_parse_commits, fast=self.use_rapidyaml)
+            batches = executor.map(parse, chunks) if executor is not None else map(parse, chunks)
+            for batch in batches:
+                for repo, commit_sha in batch:
+                    yield CommitInfo(repo=repo, commit_sha=commit_sha)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def convert_database(self, yaml_root_path: str, out_path: Optional[str] = None) -> Path:
+        """
+        Parse a PyMigBench YAML directory once, and save its migrations' commits as JSON lines.
+
+        Written to the default path (see `converted_db_path`), the converted database is picked up by
+        `iter_commits_from_database` for as long as the YAML directory doesn't change.
+
+        Args:
+            yaml_root_path: Path to the directory containing PyMigBench YAML files
+            out_path: Where to write the converted database; next to the YAML directory if None
+
+        Returns:
+            Path of the converted database
+        """
+        yaml_root = Path(yaml_root_path)
+        paths = _list_yaml_files(yaml_root)
+        db_path = Path(out_path) if out_path is not None else converted_db_path(yaml_root)
+
+        # Written aside and renamed into place, so a reader never sees a partial file
+        tmp_path = db_path.with_name(db_path.name + ".tmp")
+        count = 0
+        with open(tmp_path, "wb") as f:
+            for commit in self._iter_commits_from_yaml(yaml_root, paths):
+                f.write(_dumps({"repo": commit.repo, "commit": commit.commit_sha}) + b"\n")
+                count += 1
+        os.replace(tmp_path, db_path)
+        self.logger.info("Converted %d migrations from %s into %s", count, yaml_root, db_path)
+        return db_path
 
     def load_all_commits_from_database(self, yaml_root_path: str) -> List[CommitInfo]:
         """
         Load migration data from PyMigBench dataset using the official API.
+
+        This waits for the whole directory to be parsed; use `iter_commits_from_database` to process commits
+        as they're parsed instead.
         
         Args:
             yaml_root_path: Path to the directory containing PyMigBench YAML files
             
         Returns:
-            List of CommitInfo objects
+            List of unique CommitInfo objects, in order of first occurrence
         """
         try:
-            # Load the PyMigBench database from the specified YAML directory
-            from pathlib import Path
-            yaml_root = Path(yaml_root_path)
-            
-            if not yaml_root.exists():
-                raise FileNotFoundError(f"PyMigBench YAML directory not found: {yaml_root}")
-            
-            db = Database.load_from_dir(yaml_root)
-            self.logger.info(f"Loaded PyMigBench database from {yaml_root}")
-            
-            migrations = db.migs()
-            self.logger.info(f"Found {len(migrations)} migrations in PyMigBench")
-            
+            # Several migrations can share a commit; keep the first occurrence of each, in order
             commits = []
-            
-            # Extract commits from all migrations
-            for migration in migrations:
-                commit_info = CommitInfo(
-                    repo=migration.repo,
-                    commit_sha=migration.commit
-                )
-                commits.append(commit_info)
-            
-            self.logger.info(f"Found {len(commits)} unique commits")
+            seen: set[CommitInfo] = set()
+            total = 0
+            for commit in self.iter_commits_from_database(yaml_root_path):
+                total += 1
+                if commit not in seen:
+                    seen.add(commit)
+                    commits.append(commit)
+            self.logger.info("Found %d unique commits in %d migrations", len(commits), total)
             return commits
             
         except Exception as e:
-            self.logger.error(f"Error loading PyMigBench database: {e}")
+            self.logger.error("Error loading PyMigBench database: %s", e)
             raise
 
     def load_single_commit_from_yaml(self, yaml_file_path: str) -> CommitInfo:
@@ -78,9 +352,6 @@ class PyMigBenchLoader:
         )
         return commit_info
 
-    # parse_mig_from_file function is copied from PyMigBench's source code
     def parse_mig_from_file(self, path: Path) -> Migration:
-        raw = yaml.unsafe_load(path.read_text("utf8"))
-        migration = parse_migration(raw)
-        return migration
+        return _parse_mig_file(path)
 
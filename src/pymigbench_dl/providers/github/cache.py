@@ -0,0 +1,51 @@
+"""
+Persistent cache of conditional-request validators (ETags) for GitHub commit lookups.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+class ETagCache:
+    """
+    SQLite-backed map from (repo, sha) to the ETag of its last 200 commit lookup and the parents it returned.
+
+    Sending the ETag back as `If-None-Match` lets GitHub answer `304 Not Modified`, which has no body
+    and doesn't count against the primary rate limit. Only the parent count and first parent are kept,
+    not the commit payload (which includes every file's patch).
+
+    Safe to share between threads: all access goes through one connection guarded by a lock.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parents ("
+                "repo TEXT NOT NULL, sha TEXT NOT NULL, etag TEXT NOT NULL, parent_count INTEGER NOT NULL, parent_sha TEXT, "
+                "PRIMARY KEY (repo, sha))"
+            )
+            self._conn.commit()
+
+    def get(self, repo: str, sha: str) -> Optional[Tuple[str, int, Optional[str]]]:
+        """Return (etag, parent_count, first_parent_sha) stored for the commit, or None if not cached."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, parent_count, parent_sha FROM parents WHERE repo = ? AND sha = ?", (repo, sha)
+            ).fetchone()
+
+    def put(self, repo: str, sha: str, etag: str, parent_count: int, parent_sha: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parents (repo, sha, etag, parent_count, parent_sha) VALUES (?, ?, ?, ?, ?)",
+                (repo, sha, etag, parent_count, parent_sha),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
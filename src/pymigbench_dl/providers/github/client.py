@@ -2,24 +2,151 @@
 GitHub API client for downloading commits and getting parent information.
 """
 
+import itertools
+import json
+import re
 import requests
 import logging
+import shutil
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, cast
+
+from .cache import ETagCache
+from .models import CommitInfo
+from .ratelimit import GitHubRateLimiter, RateLimitError
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# GitHub caps a single GraphQL query at 500k nodes; 100 aliased commits stays far below that
+GRAPHQL_BATCH_SIZE = 100
+
+# Full or abbreviated commit SHA. Anything else (e.g. a branch name) would resolve to a moving target
+_SHA_RE = re.compile(r"[0-9a-f]{7,40}")
+FULL_SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+# Buffer size when saving a tarball to a file
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Tarballs are gzipped already; ask for no transport encoding on top, which would only be decoded again
+TARBALL_HEADERS = {"Accept-Encoding": "identity"}
+# Times a request rejected by a rate limit is retried (after waiting as GitHub asks) before giving up
+RATE_LIMIT_MAX_RETRIES = 3
+# Wait before retrying a secondary rate limit response that doesn't say how long to wait, per GitHub's docs
+SECONDARY_RATE_LIMIT_WAIT = 60
 
 
 class GitHubClient:
     """Client for interacting with GitHub API."""
     
-    def __init__(self, github_token: str):
-        self.github_token = github_token
-        self.session = requests.Session()
-        self.session.headers.update({
+    def __init__(self, github_token: str | Sequence[str], pool_maxsize: int = 10, etag_cache_path: Optional[Path] = None):
+        """
+        Args:
+            github_token: GitHub token used for every request, or several tokens to spread requests over.
+                Each token has its own session and rate-limit budget, and requests rotate between them.
+            pool_maxsize: Number of keep-alive connections kept per host. Should be at least the number
+                of threads sharing this client, otherwise connections beyond the pool are discarded and
+                every extra request pays a fresh TCP + TLS handshake.
+            etag_cache_path: SQLite file to persist ETags of commit lookups in, so re-runs can use
+                conditional requests. No caching if None.
+        """
+        tokens = [github_token] if isinstance(github_token, str) else list(github_token)
+        if not tokens:
+            raise ValueError("At least one GitHub token is required")
+        self.etag_cache = ETagCache(etag_cache_path) if etag_cache_path is not None else None
+        self.github_token = tokens[0]
+        self.sessions = [self._make_session(token, pool_maxsize) for token in tokens]
+        # GitHub budgets each token separately
+        self.rate_limiters = [GitHubRateLimiter() for _ in tokens]
+        self.session, self.rate_limiter = self.sessions[0], self.rate_limiters[0]
+        self._next_session = itertools.count()
+        # Parentage of a commit never changes, so lookups are kept for the client's lifetime.
+        # (repo, sha) -> (parent_count, first_parent_sha)
+        self._parents: Dict[Tuple[str, str], Tuple[int, Optional[str]]] = {}
+        # (repo, abbreviated sha) -> full sha
+        self._full_shas: Dict[Tuple[str, str], str] = {}
+        self._parents_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _make_session(github_token: str, pool_maxsize: int) -> requests.Session:
+        session = requests.Session()
+        session.headers.update({
             "Authorization": f"token {github_token}",
             "Accept": "application/vnd.github.v3+json",
             "User-Agent": "pymigbench-dl"
         })
-        self.logger = logging.getLogger(__name__)
+        # Transient server errors and connection failures are retried here with exponential backoff.
+        # Rate-limit responses (403/429) are left to _request, which waits as long as GitHub asks and tracks
+        # the budget, so they're never slept on twice.
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            # Our only POSTs are read-only GraphQL queries, which are as safe to repeat as GETs
+            allowed_methods=frozenset({"GET", "POST"}),
+            # Hand the last response back so callers' raise_for_status reports the real status
+            raise_on_status=False,
+        )
+        session.mount("https://", HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry))
+        return session
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the next token's session that has budget left, waiting until a reset if none has.
+
+        A response rejected by a rate limit (403/429 with the budget at 0 or a Retry-After header) is retried
+        after waiting as long as GitHub asks, up to RATE_LIMIT_MAX_RETRIES times; then RateLimitError is raised.
+        """
+        resource = "graphql" if url == GRAPHQL_URL else "core"
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            i = self._pick_session(resource)
+            session, rate_limiter = self.sessions[i], self.rate_limiters[i]
+            rate_limiter.acquire(resource)
+            response = session.request(method, url, **kwargs)
+            rate_limiter.update(response.headers, resource)
+
+            delay = self._rate_limit_delay(response)
+            if delay is None:
+                return response
+            response.close()
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                break
+            # With the primary budget at 0, the limiter already holds the next acquire until the reset
+            if delay > 0:
+                self.logger.warning("Rate limited by GitHub on %s, retrying in %.0fs", url, delay)
+                time.sleep(delay)
+        raise RateLimitError(f"Still rate limited by GitHub after {RATE_LIMIT_MAX_RETRIES} retries: {method} {url}")
+
+    def _pick_session(self, resource: str) -> int:
+        """Index of the next session in round-robin order that has budget left, or just the next one if none has."""
+        start = next(self._next_session)
+        for offset in range(len(self.sessions)):
+            i = (start + offset) % len(self.sessions)
+            if self.rate_limiters[i].has_budget(resource):
+                return i
+        return start % len(self.sessions)
+
+    @staticmethod
+    def _rate_limit_delay(response: requests.Response) -> Optional[float]:
+        """Seconds to wait before retrying `response` if it was rejected by a rate limit, None otherwise."""
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:  # HTTP-date form, which GitHub doesn't use
+                return SECONDARY_RATE_LIMIT_WAIT
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            return 0
+        if response.status_code == 429:
+            return SECONDARY_RATE_LIMIT_WAIT
+        # Plain 403: a permission problem, not a rate limit
+        return None
 
     def get_commit_parents(self, repo: str, commit_sha: str) -> Tuple[int, Optional[str]]:
         """
@@ -32,19 +159,163 @@ class GitHubClient:
         Returns:
             Tuple of (parent_count, first_parent_sha)
         """
-        self.logger.debug(f"Getting parent commit of repo {repo} commit {commit_sha}")
+        with self._parents_lock:
+            known = self._parents.get((repo, commit_sha))
+        if known is not None:
+            return known
+
+        self.logger.debug("Getting parent commit of repo %s commit %s", repo, commit_sha)
         url = f"https://api.github.com/repos/{repo}/commits/{commit_sha}"
-        response = self.session.get(url)
-        response.raise_for_status()
-        
-        commit_data = response.json()
-        parents = commit_data.get("parents", [])
-        
-        parent_count = len(parents)
-        first_parent_sha = parents[0]["sha"] if parents else None
-        
+        cached = self.etag_cache.get(repo, commit_sha) if self.etag_cache is not None else None
+        headers = {"If-None-Match": cached[0]} if cached is not None else {}
+        response = self._request("GET", url, headers=headers)
+
+        if cached is not None and response.status_code == 304:
+            # Not modified: free w.r.t. the rate limit, and we already have what we need
+            _, parent_count, first_parent_sha = cached
+        else:
+            response.raise_for_status()
+            parents = response.json().get("parents", [])
+            parent_count = len(parents)
+            first_parent_sha = parents[0]["sha"] if parents else None
+            etag = response.headers.get("ETag")
+            if self.etag_cache is not None and etag:
+                self.etag_cache.put(repo, commit_sha, etag, parent_count, first_parent_sha)
+
+        with self._parents_lock:
+            self._parents[(repo, commit_sha)] = (parent_count, first_parent_sha)
         return parent_count, first_parent_sha
 
+    def resolve_commit_sha(self, repo: str, commit_sha: str) -> str:
+        """
+        Full SHA of a commit given by a possibly abbreviated SHA, as some dataset entries are.
+        Full SHAs are returned as is; abbreviated ones resolved by `get_commit_parents_batch` cost no request.
+        """
+        if FULL_SHA_RE.fullmatch(commit_sha):
+            return commit_sha
+        with self._parents_lock:
+            known = self._full_shas.get((repo, commit_sha))
+        if known is not None:
+            return known
+
+        url = f"https://api.github.com/repos/{repo}/commits/{commit_sha}"
+        # This media type returns just the full SHA, without the commit payload
+        response = self._request("GET", url, headers={"Accept": "application/vnd.github.sha"})
+        response.raise_for_status()
+        full_sha = response.text.strip()
+        with self._parents_lock:
+            self._full_shas[(repo, commit_sha)] = full_sha
+        return full_sha
+
+    def get_commit_parents_batch(self, commits: List[CommitInfo]) -> Dict[Tuple[str, str], Tuple[int, Optional[str]]]:
+        """
+        Look up parents of many commits with batched GraphQL queries, up to GRAPHQL_BATCH_SIZE commits per request.
+
+        Abbreviated SHAs are resolved too, as long as they're unambiguous in their repo; their full SHA is then
+        remembered for `resolve_commit_sha`.
+        This is best-effort: commits that can't be resolved this way (repo not found, ambiguous SHA,
+        failed batch) are left out of the result, and callers should fall back to `get_commit_parents`.
+
+        Args:
+            commits: Commits to query
+
+        Returns:
+            Dict mapping (repo, commit_sha) to (parent_count, first_parent_sha)
+        """
+        results: Dict[Tuple[str, str], Tuple[int, Optional[str]]] = {}
+        full_shas: Dict[Tuple[str, str], str] = {}
+        queryable = []
+        with self._parents_lock:
+            # Each distinct commit is only queried once, however many times it's listed
+            for c in dict.fromkeys(commits):
+                known = self._parents.get((c.repo, c.commit_sha))
+                if known is not None:
+                    results[(c.repo, c.commit_sha)] = known
+                elif "/" in c.repo and _SHA_RE.fullmatch(c.commit_sha):
+                    queryable.append(c)
+        for start in range(0, len(queryable), GRAPHQL_BATCH_SIZE):
+            batch = queryable[start:start + GRAPHQL_BATCH_SIZE]
+            self.logger.debug("Querying parents of %d commits via GraphQL (%d/%d)", len(batch), start + len(batch), len(queryable))
+            try:
+                data = self._query_parents_batch(batch)
+            except Exception as e:
+                self.logger.warning("GraphQL parent lookup failed for %d commits, falling back to REST: %s", len(batch), e)
+                continue
+            for i, commit in enumerate(batch):
+                commit_data = (data.get(f"c{i}") or {}).get("object") or {}
+                if "parents" not in commit_data:
+                    continue
+                parents = commit_data["parents"]
+                first_parent_sha = parents["nodes"][0]["oid"] if parents["nodes"] else None
+                results[(commit.repo, commit.commit_sha)] = (parents["totalCount"], first_parent_sha)
+                if commit_data.get("oid") and commit_data["oid"] != commit.commit_sha:
+                    full_shas[(commit.repo, commit.commit_sha)] = commit_data["oid"]
+            with self._parents_lock:
+                self._parents.update(results)
+                self._full_shas.update(full_shas)
+        return results
+
+    def _query_parents_batch(self, batch: List[CommitInfo]) -> dict:
+        fields = []
+        for i, commit in enumerate(batch):
+            owner, name = commit.repo.split("/", 1)
+            fields.append(
+                f"c{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ "
+                f"object(expression: {json.dumps(commit.commit_sha)}) {{ "
+                f"... on Commit {{ oid parents(first: 1) {{ totalCount nodes {{ oid }} }} }} }} }}"
+            )
+        query = "query {\n" + "\n".join(fields) + "\n}"
+
+        response = self._request("POST", GRAPHQL_URL, json={"query": query})
+        response.raise_for_status()
+
+        payload = response.json()
+        # Missing repos/commits come back as null fields plus an entry in "errors"; only a missing
+        # "data" means the whole batch failed.
+        if payload.get("data") is None:
+            raise RuntimeError(f"GraphQL query failed: {payload.get('errors')}")
+        return payload["data"]
+
+    def compare_commits(self, repo: str, base_sha: str, head_sha: str) -> Tuple[str, List[dict]]:
+        """
+        Get the files changed between two commits, and the tree SHA of the head commit.
+
+        Args:
+            repo: Repository in format "owner/name"
+            base_sha: Commit SHA to compare from, e.g. the parent
+            head_sha: Commit SHA to compare to
+
+        Returns:
+            Tuple of (head_tree_sha, changed_files), with changed_files as listed by GitHub's compare API
+            (dicts with "filename", "status" and, for renames, "previous_filename"). GitHub lists at most
+            300 files.
+        """
+        url = f"https://api.github.com/repos/{repo}/compare/{base_sha}...{head_sha}"
+        response = self._request("GET", url)
+        response.raise_for_status()
+        data = response.json()
+        head_tree_sha = data["commits"][-1]["commit"]["tree"]["sha"]
+        return head_tree_sha, data.get("files", [])
+
+    def download_file(self, repo: str, path: str, commit_sha: str, output_path: Path) -> None:
+        """
+        Download a single file of a commit.
+
+        Args:
+            repo: Repository in format "owner/name"
+            path: Path of the file in the repository
+            commit_sha: Commit SHA to take the file from
+            output_path: Path where to save the file
+        """
+        url = f"https://api.github.com/repos/{repo}/contents/{urllib.parse.quote(path)}"
+        headers = {"Accept": "application/vnd.github.raw"}
+
+        with self._request("GET", url, params={"ref": commit_sha}, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+
     def download_commit_tar(self, repo: str, commit_sha: str, output_path: Path) -> None:
         """
         Download a specific commit as a tarball from GitHub.
@@ -58,10 +329,32 @@ class GitHubClient:
         """
         url = f"https://api.github.com/repos/{repo}/tarball/{commit_sha}"
         
-        response = self.session.get(url, stream=True)
-        response.raise_for_status()
-        
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        with self._request("GET", url, headers=TARBALL_HEADERS, stream=True) as response:
+            response.raise_for_status()
+            # Undo transport-level Content-Encoding only; the file keeps the tarball's own gzip layer
+            response.raw.decode_content = True
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+
+    @contextmanager
+    def open_commit_tar(self, repo: str, commit_sha: str) -> Iterator[BinaryIO]:
+        """
+        Open a specific commit's tarball from GitHub as a stream, without saving it anywhere.
+
+        The stream isn't seekable, so it must be consumed in a streaming mode (e.g. `tarfile` mode "r|gz"),
+        which lets extraction proceed as bytes arrive instead of after the whole archive is downloaded.
+
+        Args:
+            repo: Repository in format "owner/name"
+            commit_sha: Commit SHA to download
+
+        Yields:
+            File-like object over the gzipped tarball bytes
+        """
+        url = f"https://api.github.com/repos/{repo}/tarball/{commit_sha}"
 
+        with self._request("GET", url, headers=TARBALL_HEADERS, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # urllib3's HTTPResponse is a readable binary stream
+            yield cast(BinaryIO, response.raw)
@@ -0,0 +1,133 @@
+"""
+Local git mirrors of GitHub repos, an alternative to downloading one tarball per commit.
+"""
+
+import base64
+import logging
+import subprocess
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, cast
+
+from ...utils.git import run_git
+from .client import FULL_SHA_RE
+
+
+class GitHubMirror:
+    """
+    Bare repos under `cache_dir`, one per GitHub repo, into which commits are shallow-fetched on demand.
+
+    All commits of a repo share one object store, so fetching a commit whose parent (or sibling) is
+    already there only transfers the objects that differ, instead of another full tarball. Snapshots
+    are served through the same `open_commit_tar` interface as GitHubClient, produced by `git archive`
+    (uncompressed, unlike GitHub's).
+
+    The mirrors persist across runs. Safe to share between threads: fetches into the same repo are
+    serialized, archiving is not.
+    """
+
+    def __init__(self, cache_dir: Path, github_token: str, base_url: str = "https://github.com"):
+        """
+        Args:
+            cache_dir: Directory holding the bare repos
+            github_token: GitHub token, passed to git through the environment so it never lands in
+                a git config file or the process arguments
+            base_url: Where repos are fetched from, as "{base_url}/{owner}/{name}.git"
+        """
+        self.cache_dir = cache_dir
+        self.base_url = base_url
+        basic = base64.b64encode(f"x-access-token:{github_token}".encode()).decode()
+        self._git_env = {
+            "GIT_TERMINAL_PROMPT": "0",
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": f"http.{base_url}/.extraheader",
+            "GIT_CONFIG_VALUE_0": f"AUTHORIZATION: basic {basic}",
+        }
+        self._repo_locks: Dict[str, threading.Lock] = {}
+        self._repo_locks_guard = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _repo_lock(self, repo: str) -> threading.Lock:
+        with self._repo_locks_guard:
+            return self._repo_locks.setdefault(repo, threading.Lock())
+
+    def _mirror_dir(self, repo: str) -> Path:
+        return self.cache_dir / f"{repo.replace('/', '_')}.git"
+
+    def _has_commit(self, mirror_dir: Path, commit_sha: str) -> bool:
+        try:
+            run_git(mirror_dir, "cat-file", "-e", f"{commit_sha}^{{commit}}")
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def _ensure_commit(self, repo: str, commit_sha: str) -> Path:
+        return self.fetch_commits(repo, [commit_sha])
+
+    def fetch_commits(self, repo: str, commit_shas: Iterable[str]) -> Path:
+        """
+        Make sure the mirror of `repo` has every commit of `commit_shas`, fetching the missing ones in a single
+        shallow fetch.
+
+        Fetching a parent and its child together sends the objects they share once, in one pack and one
+        round trip, where fetching them one after the other negotiates twice. Blobs can't be left out
+        (e.g. with a partial clone) since `git archive` needs every one of them anyway.
+
+        Args:
+            repo: Repository in format "owner/name"
+            commit_shas: Full SHAs of the commits; servers don't resolve abbreviated SHAs in fetches
+                (see GitHubClient.resolve_commit_sha)
+
+        Returns:
+            Path of the bare mirror repo
+        """
+        commit_shas = list(commit_shas)
+        for sha in commit_shas:
+            if not FULL_SHA_RE.fullmatch(sha):
+                raise ValueError(f"Git mirrors can only fetch full commit SHAs, got {repo}@{sha}")
+        mirror_dir = self._mirror_dir(repo)
+        with self._repo_lock(repo):
+            if not (mirror_dir / "HEAD").exists():
+                mirror_dir.mkdir(parents=True, exist_ok=True)
+                run_git(mirror_dir, "init", "--bare", "--quiet")
+                # Fetched commits are kept alive by refs below; never let auto-gc repack mid-run
+                run_git(mirror_dir, "config", "gc.auto", "0")
+            missing = [sha for sha in dict.fromkeys(commit_shas) if not self._has_commit(mirror_dir, sha)]
+            if missing:
+                self.logger.info("Fetching %s@%s into mirror %s", repo, ",".join(missing), mirror_dir)
+                run_git(mirror_dir, "fetch", "--quiet", "--depth=1", "--no-tags", f"{self.base_url}/{repo}.git",
+                        *(f"+{sha}:refs/commits/{sha}" for sha in missing),
+                        env=self._git_env)
+        return mirror_dir
+
+    @contextmanager
+    def open_commit_tar(self, repo: str, commit_sha: str) -> Iterator[BinaryIO]:
+        """
+        Open a specific commit's snapshot as an uncompressed tarball stream, laid out like GitHub's tarballs.
+
+        Args:
+            repo: Repository in format "owner/name"
+            commit_sha: Full SHA of the commit
+
+        Yields:
+            File-like object over the tarball bytes
+        """
+        mirror_dir = self._ensure_commit(repo, commit_sha)
+        prefix = f"{repo.replace('/', '-')}-{commit_sha[:7]}/"
+        # Uncompressed: the archive is read right away through a pipe, so compressing it would only cost CPU twice
+        proc = subprocess.Popen(
+            ["git", "archive", "--format=tar", f"--prefix={prefix}", commit_sha],
+            cwd=mirror_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        # Both are pipes, never None
+        stdout, stderr_pipe = cast(BinaryIO, proc.stdout), cast(BinaryIO, proc.stderr)
+        try:
+            yield stdout
+        finally:
+            stdout.close()
+            stderr = stderr_pipe.read()
+            stderr_pipe.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, proc.args, stderr=stderr)
@@ -7,9 +7,9 @@ from pymigbench.migration import Migration
 from typing import Self
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CommitInfo:
-    """Information about a commit to be downloaded."""
+    """Information about a commit to be downloaded. Hashable, so it can key dicts and sets."""
     repo: str
     commit_sha: str
 
@@ -0,0 +1,68 @@
+"""
+Client-side view of GitHub's rate-limit budget.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Mapping, Tuple
+
+
+class RateLimitError(RuntimeError):
+    """GitHub kept rejecting a request for exceeding a rate limit, even after waiting as it asked."""
+
+
+class GitHubRateLimiter:
+    """
+    Token bucket fed by GitHub's `X-RateLimit-*` response headers, shared by every thread using a client.
+
+    Each request takes a token from its resource's bucket (GitHub budgets `core` REST calls and `graphql`
+    queries separately). While tokens are left, `acquire` returns immediately; once the bucket is empty, it
+    sleeps until the window resets. Every response then overwrites the bucket with GitHub's own count.
+    Until the first response of a resource arrives its budget is unknown and requests aren't held back.
+    """
+
+    def __init__(self, threshold: int = 0):
+        """
+        Args:
+            threshold: Number of requests to keep in reserve; callers block once the budget drops to it
+        """
+        self.threshold = threshold
+        # resource -> (remaining, reset_at as unix time)
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def acquire(self, resource: str = "core") -> None:
+        while True:
+            with self._lock:
+                bucket = self._buckets.get(resource)
+                if bucket is None:
+                    return
+                remaining, reset_at = bucket
+                now = time.time()
+                if now >= reset_at:
+                    # Window rolled over; budget is unknown again until the next response
+                    del self._buckets[resource]
+                    return
+                if remaining > self.threshold:
+                    self._buckets[resource] = (remaining - 1, reset_at)
+                    return
+                delay = reset_at - now
+            self.logger.warning("GitHub %s rate limit exhausted, sleeping %.0fs until reset", resource, delay)
+            time.sleep(delay)
+
+    def has_budget(self, resource: str = "core") -> bool:
+        """Whether `acquire` would return without waiting, as of now."""
+        with self._lock:
+            bucket = self._buckets.get(resource)
+            return bucket is None or time.time() >= bucket[1] or bucket[0] > self.threshold
+
+    def update(self, headers: Mapping[str, str], resource: str = "core") -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        resource = headers.get("X-RateLimit-Resource", resource)
+        with self._lock:
+            self._buckets[resource] = (int(remaining), float(reset))
@@ -1,10 +1,205 @@
+import contextlib
+import errno
+import io
+import os
+import shutil
 import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, cast
 
-def extract_tar_top(tar_path: Path, extract_to: Path) -> Path:
-    with tarfile.open(tar_path, "r:gz") as tf:
-        tf.extractall(extract_to)
-    subdirs = [d for d in extract_to.iterdir() if d.is_dir()]
-    if len(subdirs) != 1:
-        raise RuntimeError(f"Expected exactly 1 subdir in {tar_path}, found {len(subdirs)}")
-    return subdirs[0]
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+try:
+    # Intel ISA-L's SIMD-accelerated inflate and CRC32, ~2-3x faster than zlib on source trees
+    from isal import igzip
+except ImportError:  # optional, install the `isal` extra
+    igzip = None  # type: ignore[assignment]
+
+# Threads writing extracted files. Repo tarballs are mostly many small files, so extraction is bound by
+# per-file open/write/chmod syscalls (which release the GIL) rather than by decompression.
+# With a single core the hand-off costs more than it saves, and files are written inline.
+EXTRACT_MAX_WORKERS = min(32, os.cpu_count() or 1)
+# Files read from the archive but not yet written, bounding the memory held by queued contents
+EXTRACT_MAX_PENDING = EXTRACT_MAX_WORKERS * 4
+# Larger files are streamed to disk inline rather than read whole and queued, so queued contents stay
+# under EXTRACT_MAX_PENDING * EXTRACT_MAX_QUEUED_SIZE bytes
+EXTRACT_MAX_QUEUED_SIZE = 1024 * 1024
+
+# ioctl(2) sharing all extents of a file with another one, from linux/fs.h
+FICLONE = 0x40049409
+# Bytes per copy_file_range call, or buffer size of the fallback copy
+COPY_CHUNK_SIZE = 1024 * 1024
+# Leading bytes of a gzip stream
+GZIP_MAGIC = b"\x1f\x8b"
+# Errors meaning the filesystem (or the pair of filesystems) can't clone extents or copy within the kernel
+_NO_REFLINK_ERRNOS = frozenset({errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS})
+
+def safe_member_path(root: Path, name: str) -> Path:
+    """
+    Path of the archive or repo member `name` under `root`. Raise RuntimeError if `name` is absolute or
+    contains `..`, i.e. could point outside of `root`.
+    """
+    if os.path.isabs(name) or ".." in Path(name).parts:
+        raise RuntimeError(f"Refusing to write member {name!r} outside of {root}")
+    return root / name
+
+def _write_file(path: Path, data: bytes, mode: int) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+    os.chmod(path, mode)
+
+def _stream_file(path: Path, src: BinaryIO, mode: int) -> None:
+    with open(path, "wb") as f:
+        shutil.copyfileobj(src, f, COPY_CHUNK_SIZE)
+    os.chmod(path, mode)
+
+def _reflink(fsrc: BinaryIO, fdst: BinaryIO) -> bool:
+    """Clone the extents of `fsrc` into `fdst`; False if the filesystem can't."""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError as e:
+        if e.errno not in _NO_REFLINK_ERRNOS:
+            raise
+        return False
+
+def _copy_file_data(fsrc: BinaryIO, fdst: BinaryIO) -> None:
+    """
+    Copy the rest of `fsrc` into `fdst` with copy_file_range(2) where available, so data moves within the kernel
+    (and may be cloned or offloaded by the filesystem), falling back to a buffered copy. Both copies go
+    through the file offsets, so the fallback carries on from wherever copy_file_range stopped.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_CHUNK_SIZE):
+                pass
+            return
+        except OSError as e:
+            if e.errno not in _NO_REFLINK_ERRNOS:
+                raise
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+def _clone_file(src: str, dst: str) -> None:
+    """
+    Copy `src` to `dst` as a reflink (copy-on-write clone sharing the same extents) where the filesystem
+    supports it (btrfs, xfs, bcachefs, ...), and as a regular copy otherwise.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if not _reflink(fsrc, fdst):
+            _copy_file_data(fsrc, fdst)
+    shutil.copymode(src, dst)
+
+def copy_tree(src: Path, dst: Path) -> None:
+    """
+    Copy the tree under `src` into `dst` (created if missing), keeping symlinks and file modes.
+
+    Files are reflinked when the filesystem supports it, so the copy takes no extra blocks until either side
+    is modified. Hardlinks aren't used: the copy ends up in a published repo, and an in-place edit there
+    would also change every other repo linked to the same inode.
+    """
+    shutil.copytree(src, dst, symlinks=True, copy_function=_clone_file, dirs_exist_ok=True)
+
+def _strip_top(name: str, top: str) -> str:
+    first, _, rest = name.partition("/")
+    if first != top:
+        raise RuntimeError(f"Expected every tarball member under {top!r}, found {name!r}")
+    return rest.rstrip("/")
+
+class _Unread(io.RawIOBase):
+    """Read-only stream serving `head` before the rest of `fileobj`, e.g. bytes read ahead to sniff a format."""
+
+    def __init__(self, head: bytes, fileobj: BinaryIO):
+        self._head = head
+        self._fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n], self._head = self._head[:n], self._head[n:]
+            return n
+        data = self._fileobj.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def extract_tar_strip_top(tar_file: BinaryIO, extract_to: Path) -> None:
+    """
+    Extract a tarball, gzipped or not, into `extract_to`, dropping its single top-level directory (GitHub wraps the tree in one).
+
+    Members are written straight to their final paths, so there's no extract-then-move stage.
+    The archive is read and decompressed serially (tarfile isn't thread-safe), directories are created
+    inline, and file contents are handed to a thread pool to be written out. Symlinks are created
+    after every file is written, so no write can go through a symlink from the archive.
+
+    The archive is read in streaming mode, so `tar_file` doesn't need to be seekable and can be a network stream.
+    Decompression goes through ISA-L when `isal` is installed, and through tarfile's own zlib stream otherwise.
+    Only the ISA-L path checks the gzip trailer's CRC32; it's computed alongside inflate at a negligible cost,
+    so it's kept (tarfile's stream never checks it, and relies on TLS and the tar header checksums alone).
+    An uncompressed tarball (e.g. from a local `git archive`) is told apart by its first bytes and read as is.
+
+    Args:
+        tar_file: File object over the .tar.gz or .tar
+        extract_to: Existing directory to extract the tree into
+    """
+    top = None
+    symlinks: list[tarfile.TarInfo] = []
+    pending = threading.BoundedSemaphore(EXTRACT_MAX_PENDING)
+    head = tar_file.read(len(GZIP_MAGIC))
+    gzipped = head == GZIP_MAGIC
+    stream = _Unread(head, tar_file)
+    with contextlib.ExitStack() as stack:
+        if not gzipped:
+            tf = stack.enter_context(tarfile.open(fileobj=stream, mode="r|"))
+        elif igzip is not None:
+            gz = stack.enter_context(igzip.GzipFile(fileobj=stream, mode="rb"))
+            tf = stack.enter_context(tarfile.open(fileobj=gz, mode="r|"))
+        else:
+            tf = stack.enter_context(tarfile.open(fileobj=stream, mode="r|gz"))
+        pool = stack.enter_context(ThreadPoolExecutor(EXTRACT_MAX_WORKERS))
+        futures = []
+        for member in tf:
+            if top is None:
+                top = member.name.partition("/")[0]
+            name = _strip_top(member.name, top)
+            if not name:
+                # The top-level directory itself
+                continue
+            target = safe_member_path(extract_to, name)
+            if member.isdir():
+                target.mkdir(parents=True, exist_ok=True)
+            elif member.isfile():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                # Never None for a regular file
+                src = cast(BinaryIO, tf.extractfile(member))
+                if EXTRACT_MAX_WORKERS == 1 or member.size > EXTRACT_MAX_QUEUED_SIZE:
+                    _stream_file(target, src, member.mode)
+                    continue
+                pending.acquire()
+                future = pool.submit(_write_file, target, src.read(), member.mode)
+                future.add_done_callback(lambda _: pending.release())
+                futures.append(future)
+            elif member.issym():
+                member.name = name
+                symlinks.append(member)
+            else:
+                # Never produced by `git archive`; let tarfile deal with it
+                member.name = name
+                if member.islnk():
+                    member.linkname = _strip_top(member.linkname, top)
+                tf.extract(member, extract_to)
+        for future in futures:
+            future.result()
+
+    for member in symlinks:
+        target = safe_member_path(extract_to, member.name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.symlink(member.linkname, target)
@@ -3,21 +3,40 @@ Wrapper for git commands
 """
 
 import logging
+import os
+import re
 from pathlib import Path
 import subprocess
+import tempfile
+from typing import Mapping, Optional
+
+try:
+    import pygit2
+except ImportError:  # optional, install the `pygit2` extra to build repos in-process
+    pygit2 = None  # type: ignore[assignment]
 
 from ..const.git import PYMIGBENCH_DL_GIT_USERNAME, PYMIGBENCH_DL_GIT_EMAIL
 
 logger = logging.getLogger(__name__)
 
-def run_git(repo_dir: Path, *args: str) -> str:
+# What `git check-ref-format --branch <name>` rejects: "..", "@{", "//", control chars, space and ~^:?*[\,
+# a component starting with "." or ending with ".lock", a leading "/" or "-", a trailing "/" or ".", and "HEAD"
+_INVALID_BRANCH_NAME_RE = re.compile(r"\.\.|@\{|//|[\x00-\x20\x7f~^:?*\[\\]|(?:^|/)\.|\.lock(?:/|$)|[/.]$|^[/-]|^HEAD$")
+
+def run_git(repo_dir: Path, *args: str, env: Optional[Mapping[str, str]] = None) -> str:
+    """
+    Run a git command in `repo_dir` and return its stripped stdout. Raise CalledProcessError on failure.
+
+    `env` holds extra environment variables for the command, on top of the current environment.
+    """
     cp = subprocess.run(["git", *args], cwd=repo_dir, check=True,
-                        capture_output=True, text=True)
+                        capture_output=True, text=True,
+                        env={**os.environ, **env} if env else None)
     return cp.stdout.strip()
 
 def is_git_repo(repo_dir: Path) -> bool:
     try:
-        run_git(repo_dir, "-C", str("."), "rev-parse", "--is-inside-work-tree")
+        run_git(repo_dir, "rev-parse", "--is-inside-work-tree")
         return True
     except subprocess.CalledProcessError:
         return False
@@ -35,11 +54,26 @@ def get_cur_branch_name(repo_dir: Path) -> str:
     """
     return run_git(repo_dir, "rev-parse", "--abbrev-ref", "HEAD")
 
-def check_branch_name(repo_dir: Path, name: str):
+def is_valid_branch_name(name: str) -> bool:
+    """
+    Whether `name` is a valid branch name, following `git check-ref-format` without running git.
+    """
+    return bool(name) and _INVALID_BRANCH_NAME_RE.search(name) is None
+
+def check_branch_name(repo_dir: Path, name: str, strict: bool = False):
     """
     Validate if a branch name is valid in git. Raise if not.
+
+    With `strict`, the name is also checked by `git check-ref-format --branch` itself, for callers that would
+    rather pay for a subprocess than rely on `is_valid_branch_name` tracking git's rules.
     """
-    run_git(repo_dir, "check-ref-format", f"refs/heads/{name}")
+    if not is_valid_branch_name(name):
+        raise ValueError(f"Invalid git branch name {name!r}")
+    if strict:
+        try:
+            run_git(repo_dir, "check-ref-format", "--branch", name)
+        except subprocess.CalledProcessError:
+            raise ValueError(f"Invalid git branch name {name!r}") from None
     return name
 
 def safe_create_branch_and_checkout(repo_dir: Path, branch_name: str): 
@@ -50,14 +84,14 @@ def safe_create_branch_and_checkout(repo_dir: Path, branch_name: str):
     - the repo_dir is a git repo
     - 
     """
+    check_branch_name(repo_dir, branch_name)
+
     if not is_git_repo(repo_dir):
         raise RuntimeError(f"Can't create branch '{branch_name}' at path {repo_dir} because it's not a git repo.")
 
     if branch_exists(repo_dir, branch_name):
         raise RuntimeError(f"Can't create branch '{branch_name}' at path {repo_dir} because the branch name '{branch_name}' conflicts with an existing branch")
 
-    check_branch_name(repo_dir, branch_name)
-
     run_git(repo_dir, "checkout", "-b", branch_name) 
 
 def add_and_commit(repo_dir, commit_msg: str):
@@ -69,3 +103,58 @@ def add_and_commit(repo_dir, commit_msg: str):
         "-m", commit_msg
     )
 
+def init_and_commit(repo_dir: Path, branch_name: str, commit_msg: str) -> None:
+    """
+    `git init` a repo on `branch_name` and commit the whole worktree as its first commit.
+
+    Uses libgit2 in-process through pygit2 when it's installed, which saves the fork/exec of the three
+    git subprocesses otherwise needed; falls back to the git CLI if not.
+    """
+    if pygit2 is None:
+        run_git(repo_dir, "init", "-b", branch_name)
+        add_and_commit(repo_dir, commit_msg)
+        return
+
+    repo = pygit2.init_repository(str(repo_dir), initial_head=branch_name)
+    index = repo.index
+    index.add_all()
+    index.write()
+    tree = index.write_tree()
+    sig = pygit2.Signature(PYMIGBENCH_DL_GIT_USERNAME, PYMIGBENCH_DL_GIT_EMAIL)
+    repo.create_commit("HEAD", sig, sig, commit_msg, tree, [])
+
+def commit_dir_as_branch(repo_dir: Path, tree_dir: Path, branch_name: str, commit_msg: str) -> str:
+    """
+    Commit the contents of `tree_dir` on top of HEAD as the new branch `branch_name`. Raise if the branch exists.
+    Returns the SHA of the committed tree.
+
+    `tree_dir` is staged instead of `repo_dir`'s worktree, so HEAD, the index and the worktree of `repo_dir`
+    are left untouched, with no checkout back and forth. Uses pygit2 when it's installed, and a throwaway
+    index with the git CLI otherwise.
+    """
+    if pygit2 is None:
+        with tempfile.TemporaryDirectory() as t:
+            env = {"GIT_INDEX_FILE": str(Path(t) / "index")}
+            run_git(repo_dir, "--work-tree", os.path.abspath(tree_dir), "add", "-A", env=env)
+            tree = run_git(repo_dir, "write-tree", env=env)
+        commit = run_git(repo_dir,
+            "-c", f"user.name={PYMIGBENCH_DL_GIT_USERNAME}",
+            "-c", f"user.email={PYMIGBENCH_DL_GIT_EMAIL}",
+            "commit-tree", tree, "-p", "HEAD", "-m", commit_msg
+        )
+        run_git(repo_dir, "branch", branch_name, commit)
+        return tree
+
+    # A fresh Repository, pointed at tree_dir before anything (e.g. ignore rules) is read from the worktree
+    repo = pygit2.Repository(str(repo_dir))
+    repo.workdir = os.path.abspath(tree_dir)
+    # Only the in-memory index is changed; it's never written back to .git/index
+    index = repo.index
+    index.clear()
+    index.add_all()
+    tree = index.write_tree()
+    sig = pygit2.Signature(PYMIGBENCH_DL_GIT_USERNAME, PYMIGBENCH_DL_GIT_EMAIL)
+    head = repo.head.target
+    commit = repo.create_commit(None, sig, sig, commit_msg, tree, [head])
+    repo.branches.local.create(branch_name, repo[commit].peel(pygit2.Commit))
+    return str(tree)
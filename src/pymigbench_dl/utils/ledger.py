@@ -0,0 +1,61 @@
+"""
+Persistent record of what happened to each migration commit, so resumed runs don't redo settled work.
+"""
+
+import sqlite3
+import threading
+import time
+from enum import StrEnum
+from pathlib import Path
+from typing import Optional
+
+from ..providers.github.models import CommitInfo
+
+
+class CommitState(StrEnum):
+    DOWNLOADED = "DOWNLOADED"
+    SKIPPED_MULTI_PARENT = "SKIPPED_MULTI_PARENT"
+    SKIPPED_NO_PARENT = "SKIPPED_NO_PARENT"
+    FAILED = "FAILED"
+
+
+# States that can't change on a re-run: a commit's parents are immutable.
+# DOWNLOADED isn't one of them because the output folder is the source of truth (users may delete it to re-download).
+TERMINAL_STATES = frozenset({CommitState.SKIPPED_MULTI_PARENT, CommitState.SKIPPED_NO_PARENT})
+
+
+class DownloadLedger:
+    """
+    SQLite table of (repo, sha) -> latest state. Safe to share between threads.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                "repo TEXT NOT NULL, sha TEXT NOT NULL, state TEXT NOT NULL, parent_sha TEXT, ts INTEGER NOT NULL, "
+                "PRIMARY KEY (repo, sha))"
+            )
+
+    def get(self, commit: CommitInfo) -> Optional[CommitState]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM ledger WHERE repo = ? AND sha = ?", (commit.repo, commit.commit_sha)
+            ).fetchone()
+        return CommitState(row[0]) if row is not None else None
+
+    def put(self, commit: CommitInfo, state: CommitState, parent_sha: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ledger (repo, sha, state, parent_sha, ts) VALUES (?, ?, ?, ?, ?)",
+                (commit.repo, commit.commit_sha, state.value, parent_sha, int(time.time())),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
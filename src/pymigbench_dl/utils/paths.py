@@ -1,3 +1,5 @@
+import errno
+from functools import lru_cache
 from pathlib import Path
 import os
 
@@ -11,9 +13,22 @@ def to_path(p: str, check_exists=False) -> Path:
     ./src/utils/ => /home/user/projects/src/utils
     $HOME/projects => /home/user/projects
 
+    Results are cached per working directory, so converting the same path again costs no `stat` calls
+    (other than the existence check, if asked for).
+    Environment variables and symlinks are assumed not to change while the process runs.
+
     Args:
         p: Path as a string.
         check_exists: If true, check if path exists, and raise FileNotFoundError if not
     """
+    path = _to_path_cached(str(p), os.getcwd())
+    # Outside the cache: the path may have been created or removed since it was first converted
+    if check_exists and not path.exists():
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
+    return path
+
+@lru_cache(maxsize=1024)
+def _to_path_cached(p: str, cwd: str) -> Path:
+    # `cwd` is only part of the cache key: relative paths resolve against it
     expanded = os.path.expanduser(os.path.expandvars(p))
-    return Path(expanded).resolve(check_exists)
+    return Path(expanded).resolve()
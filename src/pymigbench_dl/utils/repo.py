@@ -1,8 +1,18 @@
+import contextlib
 import logging
 import os
 import shutil
+import tarfile
 import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Self
+
+import requests
+import urllib3
 
 from ..const.git import (
     DEFAULT_PRE_MIG_BRANCH_NAME,
@@ -10,65 +20,250 @@ from ..const.git import (
     PYMIGBENCH_DL_GT_MIG_COMMIT_MSG,
 )
 from ..providers.github.client import GitHubClient
+from ..providers.github.mirror import GitHubMirror
 from ..providers.github.models import CommitInfo
-from .fs import extract_tar_top
-from .git import add_and_commit, get_cur_branch_name, run_git
+from .fs import copy_tree, extract_tar_strip_top, safe_member_path
+from .git import commit_dir_as_branch, init_and_commit, run_git
 
 logger = logging.getLogger(__name__)
 
-def _clear_worktree_but_git(repo_dir: Path) -> None:
-    for p in repo_dir.iterdir():
-        if p.name == ".git":
-            continue
-        if p.is_dir() and not p.is_symlink():
-            shutil.rmtree(p)
-        else:
-            p.unlink(missing_ok=True)
+# Prefix of the per-build staging dirs created under output_dir
+STAGING_DIR_PREFIX = ".staging__"
+# Staging dirs untouched for this long belong to a run that was killed before its cleanup could run
+STALE_STAGING_AGE = 24 * 60 * 60
+# A snapshot stream that broke off or got truncated mid-way; HTTP error statuses aren't included since a retry won't fix them
+SNAPSHOT_STREAM_ERRORS = (requests.ConnectionError, requests.Timeout, urllib3.exceptions.HTTPError,
+                          EOFError, tarfile.ReadError, zlib.error)
+# Most changed files for which the migration snapshot is rebuilt from the parent's plus the changed files,
+# at one request per file against the core rate limit; beyond this a full tarball is cheaper
+DELTA_MAX_FILES = 20
+
+class UnsupportedParentsError(RuntimeError):
+    """The migration commit doesn't have exactly one parent, so there's no single pre-migration snapshot."""
+
+    def __init__(self, commit: CommitInfo, parent_count: int):
+        super().__init__(f"Unsupported parents={parent_count} for {commit.repo}@{commit.commit_sha}")
+        self.parent_count = parent_count
+
+def _clear_dir(path: Path) -> None:
+    """Empty `path`, by removing it in a single rmtree walk and recreating it."""
+    shutil.rmtree(path)
+    path.mkdir()
 
-def _move_children(src_dir: Path, dst_dir: Path) -> None:
-    for child in src_dir.iterdir():
-        shutil.move(str(child), str(dst_dir / child.name))
+def _extract_commit_tree(commit: CommitInfo, snapshots: GitHubClient | GitHubMirror, extract_to: Path) -> None:
+    """
+    Stream the tarball of `commit` from `snapshots` into `extract_to`.
+
+    If a GitHub stream breaks mid-way, whatever was extracted is cleared and the tarball is downloaded again,
+    to a file this time, then extracted from there. The file download doesn't depend on extraction keeping up.
+    """
+    logger.info("Downloading %s@%s", commit.repo, commit.commit_sha)
+    try:
+        with snapshots.open_commit_tar(commit.repo, commit.commit_sha) as tar_file:
+            extract_tar_strip_top(tar_file, extract_to=extract_to)
+        return
+    except SNAPSHOT_STREAM_ERRORS as e:
+        if not isinstance(snapshots, GitHubClient):
+            raise
+        logger.warning("Streaming %s@%s broke off (%s), downloading it to a file instead", commit.repo, commit.commit_sha, e)
 
-def _materialize_commit_tree(dst_dir: Path, commit: CommitInfo, github: GitHubClient) -> None:
+    _clear_dir(extract_to)
+    with tempfile.TemporaryDirectory(dir=extract_to.parent, prefix=f".fetch__{commit.repo_safe}__") as t:
+        tar_path = Path(t) / f"{commit.commit_sha}.tar.gz"
+        snapshots.download_commit_tar(commit.repo, commit.commit_sha, tar_path)
+        with open(tar_path, "rb") as tar_file:
+            extract_tar_strip_top(tar_file, extract_to=extract_to)
+
+def fetch_commit_tree(commit: CommitInfo, snapshots: GitHubClient | GitHubMirror, extract_to: Path) -> Path:
     """
-    Download tarball for `commit` and mirror its tree into `dst_dir`.
-    Assumes `dst_dir` exists; clears everything except .git first.
+    Download tarball for `commit` from `snapshots` and extract its tree into the existing dir `extract_to`.
+    Returns `extract_to`.
     """
-    with tempfile.TemporaryDirectory(dir=dst_dir.parent, prefix=f".fetch__{commit.repo_safe}__") as t:
-        tdir = Path(t)
-        tar_path = tdir / f"{commit.repo_safe}__{commit.commit_sha}.tar.gz"  # matches r:gz
-        logger.info("Downloading %s@%s", commit.repo, commit.commit_sha)
-        github.download_commit_tar(commit.repo, commit.commit_sha, tar_path)
-        extracted_top = extract_tar_top(tar_path, extract_to=tdir)
+    _extract_commit_tree(commit, snapshots, extract_to)
+    return extract_to
 
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        _clear_worktree_but_git(dst_dir)
-        _move_children(extracted_top, dst_dir)
+def _materialize_commit_tree(dst_dir: Path, commit: CommitInfo, snapshots: GitHubClient | GitHubMirror) -> None:
+    """
+    Download tarball for `commit` from `snapshots` and extract its tree right into `dst_dir`.
+    Creates `dst_dir` if needed, and clears whatever is already in it first.
+    """
+    if not dst_dir.exists():
+        dst_dir.mkdir(parents=True)
+    elif any(dst_dir.iterdir()):
+        _clear_dir(dst_dir)
+    _extract_commit_tree(commit, snapshots, dst_dir)
 
 def _initialize_git_repo(repo_dir: Path, branch_name: str) -> None:
     logger.debug("Initializing git repo at %s with branch %s", repo_dir, branch_name)
-    run_git(repo_dir, "init", "-b", branch_name)
-    add_and_commit(repo_dir, PYMIGBENCH_DL_PRE_MIG_COMMIT_MSG)
+    init_and_commit(repo_dir, branch_name, PYMIGBENCH_DL_PRE_MIG_COMMIT_MSG)
 
-def _create_gt_branch_from_commit(repo_dir: Path, branch_name: str,
-                                              commit: CommitInfo, github: GitHubClient) -> None:
+def _create_gt_branch_from_commit(repo_dir: Path, branch_name: str, tree: Path) -> str:
     """
-    Create a new branch at current HEAD, replace tree with `commit` snapshot, commit,
-    then switch back to the previous branch
+    Commit the extracted snapshot `tree` as a new branch on top of the current HEAD.
+    The current branch stays checked out, and its worktree isn't touched.
+    Returns the SHA of the committed tree.
     """
-    cur = get_cur_branch_name(repo_dir)
-    if cur == "HEAD":
-        raise RuntimeError("Current branch is named 'HEAD', meaning it's detached. This shouldn't happen.")
-    if cur == branch_name:
-        raise RuntimeError(f"Current branch is named '{branch_name}', which is the same as the new branch name. Name conflict!")
+    logger.debug("Creating branch %s in %s from %s", branch_name, repo_dir, tree)
+    return commit_dir_as_branch(repo_dir, tree, branch_name, PYMIGBENCH_DL_GT_MIG_COMMIT_MSG)
 
-    # fail if branch somehow exists
-    run_git(repo_dir, "checkout", "-b", branch_name)
+def _fetch_commit_delta(github_client: GitHubClient, parent: CommitInfo, commit: CommitInfo,
+                        files_dir: Path) -> tuple[str, list[dict]] | None:
+    """
+    Download the files `commit` changed relative to `parent` into `files_dir`, at their paths in the repo.
+
+    Returns (tree_sha, changed_files), or None if rebuilding the snapshot of `commit` from them isn't worth it
+    (more than DELTA_MAX_FILES changed files) or the comparison or a download failed.
+    """
+    try:
+        tree_sha, files = github_client.compare_commits(commit.repo, parent.commit_sha, commit.commit_sha)
+    except (requests.RequestException, KeyError, IndexError) as e:
+        logger.debug("Comparing %s@%s with its parent failed (%s), downloading it in full", commit.repo, commit.commit_sha, e)
+        return None
+    if len(files) > DELTA_MAX_FILES:
+        return None
+    try:
+        for f in files:
+            if f["status"] != "removed":
+                target = safe_member_path(files_dir, f["filename"])
+                target.parent.mkdir(parents=True, exist_ok=True)
+                github_client.download_file(commit.repo, f["filename"], commit.commit_sha, target)
+    except (OSError, requests.RequestException) as e:
+        logger.info("Downloading files changed by %s@%s failed (%s), downloading it in full", commit.repo, commit.commit_sha, e)
+        return None
+    return tree_sha, files
+
+def _has_symlink(tree_dir: Path, name: str) -> bool:
+    """Whether the path `name` under `tree_dir`, or any dir on the way to it, is a symlink."""
+    path = tree_dir
+    for part in Path(name).parts:
+        path = path / part
+        if path.is_symlink():
+            return True
+    return False
+
+def _apply_commit_delta(tree_dir: Path, files_dir: Path, files: list[dict]) -> None:
+    """
+    Turn the parent's snapshot in `tree_dir` into the migration snapshot, by moving in the changed `files`
+    downloaded to `files_dir` and removing the deleted ones.
+    Modified files keep their mode, renamed ones the mode of their old path, and new ones get 0644.
 
-    _materialize_commit_tree(repo_dir, commit, github)
-    add_and_commit(repo_dir, PYMIGBENCH_DL_GT_MIG_COMMIT_MSG)
+    Raises OSError if a changed path goes through a symlink of the parent's snapshot: writing there would follow
+    the link out of `tree_dir`, and GitHub's file lists can't tell a change to the link itself apart anyway.
+    """
+    for f in files:
+        names = [f["filename"]] + ([f["previous_filename"]] if "previous_filename" in f else [])
+        for name in names:
+            if _has_symlink(tree_dir, name):
+                raise OSError(f"Changed path {name!r} goes through a symlink")
+        target = safe_member_path(tree_dir, f["filename"])
+        mode = 0o644
+        if f["status"] in ("removed", "renamed"):
+            old = safe_member_path(tree_dir, f.get("previous_filename", f["filename"]))
+            mode = old.stat().st_mode
+            old.unlink()
+        if f["status"] == "removed":
+            continue
+        if target.exists():
+            mode = target.stat().st_mode
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(safe_member_path(files_dir, f["filename"]), target)
+        os.chmod(target, mode)
 
-    run_git(repo_dir, "checkout", cur)
+def _create_gt_branch_from_delta(
+    repo_dir: Path,
+    branch_name: str,
+    commit: CommitInfo,
+    tree_dir: Path,
+    files_dir: Path,
+    delta: tuple[str, list[dict]] | None,
+    github_client: GitHubClient,
+) -> None:
+    """
+    Commit the snapshot of `commit` as a new branch on top of the current HEAD, rebuilt in `tree_dir` (a copy of
+    the parent's snapshot) from `delta` and the changed files in `files_dir`.
+
+    GitHub's file lists don't carry modes or file types, so the rebuilt tree is checked against the real tree SHA.
+    Without a delta, on a mismatch (e.g. a symlink, submodule or mode change, or a tracked file the repo's
+    .gitignore ignores) or if a change goes through a symlink, the snapshot is downloaded in full and committed instead.
+    """
+    if delta is not None:
+        tree_sha, files = delta
+        try:
+            _apply_commit_delta(tree_dir, files_dir, files)
+            if _create_gt_branch_from_commit(repo_dir, branch_name, tree_dir) == tree_sha:
+                return
+            logger.info("Rebuilt snapshot of %s@%s doesn't match its tree, downloading it in full", commit.repo, commit.commit_sha)
+            run_git(repo_dir, "branch", "-D", branch_name)
+        except OSError as e:
+            logger.info("Rebuilding snapshot of %s@%s failed (%s), downloading it in full", commit.repo, commit.commit_sha, e)
+
+    _materialize_commit_tree(tree_dir, commit, github_client)
+    _create_gt_branch_from_commit(repo_dir, branch_name, tree_dir)
+
+class BuildWorkspace:
+    """
+    Staging roots and prefetch threads shared by the builds of one pool of workers, released by `close`.
+
+    Each worker thread stages its builds under its own root in `output_dir`, so a build only adds and removes its
+    own subdir, and the root stays fresh for remove_stale_staging_dirs while its thread is working.
+    Builds fetch the migration snapshot on `prefetch` while they process the parent one.
+    """
+
+    def __init__(self, output_dir: Path, max_workers: int = 1):
+        """
+        Args:
+            output_dir: Directory the repos are published to; staging roots are created in it for atomic publishing
+            max_workers: Number of builds run concurrently with this workspace
+        """
+        self.output_dir = output_dir
+        self.prefetch = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._local = threading.local()
+        self._roots: list[Path] = []
+        self._lock = threading.Lock()
+
+    def staging_root(self) -> Path:
+        """The calling thread's staging root, created on first use."""
+        root = getattr(self._local, "root", None)
+        if root is None or not root.exists():
+            root = self._local.root = Path(tempfile.mkdtemp(dir=self.output_dir, prefix=f"{STAGING_DIR_PREFIX}worker__"))
+            with self._lock:
+                self._roots.append(root)
+        return root
+
+    def close(self) -> None:
+        """Wait for pending prefetches, then remove the staging roots. Builds must be done by now."""
+        self.prefetch.shutdown()
+        with self._lock:
+            roots, self._roots = self._roots, []
+        for root in roots:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def remove_stale_staging_dirs(output_dir: Path, max_age: float = STALE_STAGING_AGE) -> int:
+    """
+    Remove staging dirs left in `output_dir` by runs that were killed (e.g. SIGKILL, reboot) before
+    TemporaryDirectory could clean them up. Only dirs older than `max_age` seconds are removed, so builds of
+    a concurrent run in the same output_dir are left alone.
+
+    Returns the number of dirs removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            if not entry.name.startswith(STAGING_DIR_PREFIX) or not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+            logger.info("Removing stale staging dir %s", entry.path)
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
 
 def create_pymigbench_type_repo(
     mig_commit_info: CommitInfo,
@@ -76,38 +271,98 @@ def create_pymigbench_type_repo(
     gt_patch_branch_name: str,
     github_client: GitHubClient,
     pre_mig_branch_name: str = DEFAULT_PRE_MIG_BRANCH_NAME,
-) -> None:
+    known_parents: tuple[int, str | None] | None = None,
+    mirror: GitHubMirror | None = None,
+    parent_tree: Path | None = None,
+    use_delta: bool = False,
+    workspace: BuildWorkspace | None = None,
+) -> str:
     """
     Transactionally build the repo:
       - Base = parent of migration commit (initial commit on pre_mig_branch_name)
       - New branch = gt_patch_branch_name with migration snapshot commit on top
     Publish to output_dir only if everything succeeds.
     Policy: if final_dir already exists, we assume it's correct and SKIP.
+
+    `known_parents` is the (parent_count, first_parent_sha) of the migration commit if the caller already
+    looked it up (e.g. in a batch); otherwise it's queried from GitHub.
+    Snapshots come from `mirror` if given, otherwise from GitHub tarballs.
+    `parent_tree` is an already extracted snapshot of the parent commit (e.g. shared with sibling commits);
+    it's copied instead of downloading the parent again, and left untouched.
+    With `use_delta` (and no mirror), the migration snapshot is rebuilt from the parent's plus the few files the
+    migration changed, downloaded one by one, instead of downloading its whole tarball; see _create_gt_branch_from_delta.
+    `workspace` holds the staging roots and prefetch threads of the caller's pool of builds; a single build gets its own.
+
+    Returns the SHA of the parent commit the base branch was built from.
+    Raises UnsupportedParentsError if the migration commit doesn't have exactly one parent.
     """
     final_dir = output_dir / mig_commit_info.folder_name
     if final_dir.exists():
         raise RuntimeError(f"Attempt to download to a non-empty folder {final_dir} for commit {mig_commit_info}")
 
-    parents, parent_sha = github_client.get_commit_parents(mig_commit_info.repo, mig_commit_info.commit_sha)
+    if known_parents is None:
+        known_parents = github_client.get_commit_parents(mig_commit_info.repo, mig_commit_info.commit_sha)
+    parents, parent_sha = known_parents
     if parents != 1 or not parent_sha:
-        raise RuntimeError(
-            f"Unsupported parents={parents} for {mig_commit_info.repo}@{mig_commit_info.commit_sha}"
-        )
+        raise UnsupportedParentsError(mig_commit_info, parents)
     parent_info = CommitInfo(mig_commit_info.repo, parent_sha)
+    snapshots = mirror if mirror is not None else github_client
+    snapshot_info = mig_commit_info
+    if mirror is not None:
+        # Git only fetches full SHAs; the output keeps the dataset's one
+        snapshot_info = CommitInfo(mig_commit_info.repo,
+                                   github_client.resolve_commit_sha(mig_commit_info.repo, mig_commit_info.commit_sha))
+        if parent_tree is None:
+            # One fetch for both, so the objects they share are only transferred once
+            mirror.fetch_commits(mig_commit_info.repo, [parent_sha, snapshot_info.commit_sha])
+    # A mirror already only transfers what changed
+    use_delta = use_delta and mirror is None
 
-    # Single staging dir on the SAME filesystem as output_dir for atomic publish
-    with tempfile.TemporaryDirectory(dir=output_dir, prefix=f".staging__{mig_commit_info.folder_name}__") as tmp:
-        staging_root = Path(tmp)
+    with contextlib.ExitStack() as stack:
+        if workspace is None:
+            workspace = stack.enter_context(BuildWorkspace(output_dir))
+        # Single staging dir on the SAME filesystem as output_dir for atomic publish
+        staging_root = Path(stack.enter_context(tempfile.TemporaryDirectory(
+            dir=workspace.staging_root(), prefix=f"{mig_commit_info.folder_name}__")))
         staging_repo = staging_root / "work"
         staging_repo.mkdir(parents=True, exist_ok=True)
+        mig_dir = staging_root / "mig"
+        mig_dir.mkdir()
+        delta_dir = staging_root / "delta"
+        delta_dir.mkdir()
+
+        # The migration snapshot (or the files it changed) is needed whatever happens to the parent one, so fetch it
+        # while the parent is being fetched and committed
+        mig_fetch: Future
+        if use_delta:
+            mig_fetch = mig_delta = workspace.prefetch.submit(_fetch_commit_delta, github_client, parent_info,
+                                                              mig_commit_info, delta_dir)
+        else:
+            mig_fetch = mig_tree = workspace.prefetch.submit(fetch_commit_tree, snapshot_info, snapshots, mig_dir)
+        # Exit callbacks run last-in first-out: the fetch is cancelled if it hasn't started yet, or waited for, before
+        # the staging dir is cleaned up
+        stack.callback(lambda: wait([mig_fetch]))
+        stack.callback(mig_fetch.cancel)
 
         # 1) parent snapshot -> initial commit
-        _materialize_commit_tree(staging_repo, parent_info, github_client)
+        if parent_tree is not None:
+            copy_tree(parent_tree, staging_repo)
+        else:
+            _materialize_commit_tree(staging_repo, parent_info, snapshots)
+        if use_delta:
+            # Base of the rebuilt migration snapshot, copied before .git exists
+            copy_tree(staging_repo, mig_dir)
         _initialize_git_repo(staging_repo, pre_mig_branch_name)
 
         # 2) GT branch -> migration snapshot commit
-        _create_gt_branch_from_commit(staging_repo, gt_patch_branch_name, mig_commit_info, github_client)
+        if use_delta:
+            _create_gt_branch_from_delta(staging_repo, gt_patch_branch_name, mig_commit_info, mig_dir, delta_dir,
+                                         mig_delta.result(), github_client)
+        else:
+            _create_gt_branch_from_commit(staging_repo, gt_patch_branch_name, mig_tree.result())
 
         # 3) publish atomically; final_dir must not exist by policy
         os.replace(staging_repo, final_dir)
         # TemporaryDirectory cleans up the now-empty staging_root
+
+    return parent_sha
@@ -0,0 +1,68 @@
+"""
+Extracted commit snapshots shared between concurrent builds, so a commit that's the parent of several
+migration commits (e.g. sibling commits of the same repo) is downloaded only once.
+"""
+
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict
+
+from ..providers.github.client import GitHubClient
+from ..providers.github.mirror import GitHubMirror
+from ..providers.github.models import CommitInfo
+from .repo import fetch_commit_tree
+
+
+class SnapshotCache:
+    """
+    Reference-counted commit -> extracted tree under `root`. Safe to share between threads.
+
+    Users `retain` a commit before they're scheduled and `release` it when done; the first `get` downloads
+    the snapshot while the others wait for it, and the tree is removed once its last user released it.
+    If the download fails, every `get` of the commit raises its error until the last user released it.
+    """
+
+    def __init__(self, root: Path, snapshots: GitHubClient | GitHubMirror):
+        self.root = root
+        self.snapshots = snapshots
+        self._lock = threading.Lock()
+        self._refs: Counter[CommitInfo] = Counter()
+        self._trees: Dict[CommitInfo, Future[Path]] = {}
+
+    def __contains__(self, commit: CommitInfo) -> bool:
+        with self._lock:
+            return commit in self._refs
+
+    def retain(self, commit: CommitInfo) -> None:
+        with self._lock:
+            self._refs[commit] += 1
+
+    def get(self, commit: CommitInfo) -> Path:
+        """Return the extracted tree of `commit`, downloading it if no other user did yet."""
+        with self._lock:
+            future = self._trees.get(commit)
+            owner = future is None
+            if future is None:
+                future = self._trees[commit] = Future()
+        if owner:
+            extract_to = Path(tempfile.mkdtemp(dir=self.root, prefix=f"{commit.folder_name}__"))
+            try:
+                future.set_result(fetch_commit_tree(commit, self.snapshots, extract_to))
+            except Exception as e:  # anything, or the users waiting on the future would block forever
+                shutil.rmtree(extract_to, ignore_errors=True)
+                future.set_exception(e)
+        return future.result()
+
+    def release(self, commit: CommitInfo) -> None:
+        with self._lock:
+            self._refs[commit] -= 1
+            if self._refs[commit] > 0:
+                return
+            del self._refs[commit]
+            future = self._trees.pop(commit, None)
+        if future is not None and future.exception() is None:
+            shutil.rmtree(future.result(), ignore_errors=True)
@@ -0,0 +1,74 @@
+"""
+Fake GitHub client for tests, answering from a local git repo instead of the API.
+"""
+
+import contextlib
+import io
+import os
+import subprocess
+from pathlib import Path
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t", "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@t",
+}
+# `git diff --name-status` letters -> GitHub compare API statuses
+STATUSES = {"A": "added", "M": "modified", "D": "removed", "R": "renamed", "T": "changed"}
+
+
+def git(cwd: Path, *args: str) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, env=GIT_ENV, check=True, capture_output=True, text=True).stdout.strip()
+
+
+class FakeClient:
+    """GitHub client answering from a local source repo, recording which snapshots and files it served."""
+
+    def __init__(self, src: Path):
+        self.src = src
+        self.tarballs: list[str] = []
+        self.files: list[str] = []
+        self.tree_sha_override: str | None = None
+
+    def get_commit_parents(self, repo, sha):
+        parents = git(self.src, "rev-list", "--parents", "-n", "1", sha).split()[1:]
+        return len(parents), parents[0] if parents else None
+
+    def resolve_commit_sha(self, repo, sha):
+        return git(self.src, "rev-parse", f"{sha}^{{commit}}")
+
+    def get_commit_parents_batch(self, commits):
+        return {(c.repo, c.commit_sha): self.get_commit_parents(c.repo, c.commit_sha) for c in commits}
+
+    def _archive(self, sha: str) -> bytes:
+        self.tarballs.append(sha)
+        return subprocess.run(["git", "archive", "--format=tar.gz", f"--prefix=o-r-{sha[:7]}/", sha],
+                              cwd=self.src, check=True, capture_output=True).stdout
+
+    @contextlib.contextmanager
+    def open_commit_tar(self, repo, sha):
+        yield io.BytesIO(self._archive(sha))
+
+    def download_commit_tar(self, repo, sha, output_path):
+        Path(output_path).write_bytes(self._archive(sha))
+
+    def compare_commits(self, repo, base, head):
+        files = []
+        for line in git(self.src, "diff", "--name-status", "-M", base, head).splitlines():
+            status, *names = line.split("\t")
+            status = STATUSES[status[0]]
+            if status == "renamed":
+                files.append({"status": status, "previous_filename": names[0], "filename": names[1]})
+            else:
+                files.append({"status": status, "filename": names[0]})
+        return self.tree_sha_override or git(self.src, "rev-parse", f"{head}^{{tree}}"), files
+
+    def download_file(self, repo, path, sha, output_path):
+        self.files.append(path)
+        Path(output_path).write_bytes(subprocess.run(["git", "show", f"{sha}:{path}"], cwd=self.src,
+                                                     check=True, capture_output=True).stdout)
+
+
+def commit(src: Path, msg: str) -> str:
+    git(src, "add", "-A")
+    git(src, "commit", "-q", "-m", msg)
+    return git(src, "rev-parse", "HEAD")
@@ -0,0 +1,24 @@
+import logging
+from pathlib import Path
+
+# Libraries that log every connection and request at DEBUG, which floods long download runs
+NOISY_LOGGERS = ("urllib3", "requests")
+
+def configure(log_file: Path, lvl: int = logging.DEBUG) -> None:
+    """
+    Configure logging to write to both console and `log_file`, keeping noisy libraries at WARNING.
+    """
+    log_file.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
+
+    handlers = [
+        logging.StreamHandler(),  # Console
+        logging.FileHandler(log_file)  # File
+    ]
+
+    logging.basicConfig(
+        level=lvl,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        handlers=handlers
+    )
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
@@ -0,0 +1,66 @@
+import subprocess
+
+import pytest
+
+from pymigbench_dl.utils.git import check_branch_name, is_valid_branch_name
+
+BRANCH_NAMES = [
+    # valid
+    "main",
+    "gt-patch",
+    "pre-mig",
+    "feature/x",
+    "a/b/c",
+    "v1.0",
+    "foo.bar",
+    "foo@bar",
+    "foo-",
+    "héllo",
+    "x.lockfile",
+    "HEADS",
+    "my/HEAD",
+    # invalid
+    "",
+    "-foo",
+    "/foo",
+    "foo/",
+    "foo.",
+    ".foo",
+    "foo/.bar",
+    "foo..bar",
+    "foo//bar",
+    "foo.lock",
+    "foo.lock/bar",
+    "foo@{bar",
+    "@",
+    "HEAD",
+    "foo bar",
+    "foo\tbar",
+    "foo~1",
+    "foo^",
+    "foo:bar",
+    "foo?",
+    "foo*",
+    "foo[bar",
+    "foo\\bar",
+    "foo\x7f",
+]
+
+
+def git_accepts(name: str, cwd) -> bool:
+    cp = subprocess.run(["git", "check-ref-format", "--branch", name], cwd=cwd, capture_output=True, check=False)
+    return cp.returncode == 0
+
+
+@pytest.mark.parametrize("name", BRANCH_NAMES)
+def test_matches_git_check_ref_format(name, tmp_path):
+    assert is_valid_branch_name(name) == git_accepts(name, tmp_path)
+
+
+@pytest.mark.parametrize("name", BRANCH_NAMES)
+def test_check_branch_name_strict(name, tmp_path):
+    if git_accepts(name, tmp_path):
+        assert check_branch_name(tmp_path, name, strict=True) == name
+    else:
+        with pytest.raises(ValueError):
+            check_branch_name(tmp_path, name, strict=True)
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from pymigbench_dl.providers.github.client import GitHubClient
+from pymigbench_dl.providers.github.ratelimit import RateLimitError
+
+REPO = "owner/name"
+SHA = "a" * 40
+COMMIT_URL = f"https://api.github.com/repos/{REPO}/commits/{SHA}"
+
+
+def exhaust(client: GitHubClient, i: int, resource: str = "core") -> None:
+    client.rate_limiters[i].update(
+        {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 3600)}, resource)
+
+
+def test_sessions_rotate_round_robin():
+    client = GitHubClient(["t0", "t1", "t2"])
+    assert [client._pick_session("core") for _ in range(6)] == [0, 1, 2, 0, 1, 2]
+
+
+def test_exhausted_token_is_skipped():
+    client = GitHubClient(["t0", "t1"])
+    exhaust(client, 0)
+    assert [client._pick_session("core") for _ in range(4)] == [1, 1, 1, 1]
+    # Budgets are per resource
+    assert [client._pick_session("graphql") for _ in range(2)] == [0, 1]
+
+
+def test_all_tokens_exhausted_falls_back_to_rotation():
+    client = GitHubClient(["t0", "t1"])
+    exhaust(client, 0)
+    exhaust(client, 1)
+    assert [client._pick_session("core") for _ in range(4)] == [0, 1, 0, 1]
+
+
+def test_request_is_sent_with_token_that_has_budget(requests_mock):
+    requests_mock.get(COMMIT_URL, json={"parents": [{"sha": "b" * 40}]})
+    client = GitHubClient(["t0", "t1"])
+    exhaust(client, 0)
+    assert client.get_commit_parents(REPO, SHA) == (1, "b" * 40)
+    assert requests_mock.last_request.headers["Authorization"] == "token t1"
+
+
+def test_rate_limited_request_is_retried_on_another_token(requests_mock):
+    requests_mock.get(COMMIT_URL, [
+        {"status_code": 403, "headers": {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 3600)}},
+        {"json": {"parents": []}},
+    ])
+    client = GitHubClient(["t0", "t1"])
+    assert client.get_commit_parents(REPO, SHA) == (0, None)
+    assert [r.headers["Authorization"] for r in requests_mock.request_history] == ["token t0", "token t1"]
+
+
+def test_rate_limit_error_after_retries(requests_mock, monkeypatch):
+    monkeypatch.setattr("pymigbench_dl.providers.github.client.RATE_LIMIT_MAX_RETRIES", 2)
+    requests_mock.get(COMMIT_URL, status_code=429, headers={"Retry-After": "0"})
+    client = GitHubClient("t0")
+    with pytest.raises(RateLimitError):
+        client.get_commit_parents(REPO, SHA)
+    assert requests_mock.call_count == 3
@@ -0,0 +1,40 @@
+import pytest
+
+from pymigbench_dl.providers.github.client import GRAPHQL_URL, GitHubClient
+from pymigbench_dl.providers.github.mirror import GitHubMirror
+from pymigbench_dl.providers.github.models import CommitInfo
+
+REPO = "owner/name"
+FULL = "abcdef1" + "0" * 33
+SHORT = FULL[:7]
+
+
+def test_full_sha_is_returned_without_request(requests_mock):
+    assert GitHubClient("t0").resolve_commit_sha(REPO, FULL) == FULL
+    assert requests_mock.call_count == 0
+
+
+def test_abbreviated_sha_is_resolved_once(requests_mock):
+    requests_mock.get(f"https://api.github.com/repos/{REPO}/commits/{SHORT}", text=FULL)
+    client = GitHubClient("t0")
+    assert client.resolve_commit_sha(REPO, SHORT) == FULL
+    assert client.resolve_commit_sha(REPO, SHORT) == FULL
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.headers["Accept"] == "application/vnd.github.sha"
+
+
+def test_abbreviated_sha_is_resolved_by_parent_lookup(requests_mock):
+    requests_mock.post(GRAPHQL_URL, json={"data": {"c0": {"object": {
+        "oid": FULL, "parents": {"totalCount": 1, "nodes": [{"oid": "b" * 40}]}}}}})
+    client = GitHubClient("t0")
+    assert client.get_commit_parents_batch([CommitInfo(REPO, SHORT)]) == {(REPO, SHORT): (1, "b" * 40)}
+    assert client.resolve_commit_sha(REPO, SHORT) == FULL
+    assert requests_mock.call_count == 1
+
+
+def test_mirror_rejects_abbreviated_sha(tmp_path):
+    mirror = GitHubMirror(tmp_path, "t0")
+    with pytest.raises(ValueError, match=f"{REPO}@{SHORT}"):
+        mirror.fetch_commits(REPO, [FULL, SHORT])
+    # Rejected before anything was set up
+    assert list(tmp_path.iterdir()) == []
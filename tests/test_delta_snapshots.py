@@ -0,0 +1,127 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from _fake_github import FakeClient, commit, git
+from pymigbench_dl.providers.github.models import CommitInfo
+from pymigbench_dl.utils import repo as repo_mod
+from pymigbench_dl.utils.repo import create_pymigbench_type_repo
+
+
+@pytest.fixture
+def src(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    git(src, "init", "-q")
+    (src / "keep.py").write_text("keep\n")
+    (src / "mod.py").write_text("old\n")
+    (src / "gone.py").write_text("gone\n")
+    (src / "pkg").mkdir()
+    (src / "pkg" / "old_name.py").write_text("renamed\n" * 20)
+    (src / "run.sh").write_text("#!/bin/sh\n")
+    os.chmod(src / "run.sh", 0o755)
+    return src
+
+
+def build(tmp_path: Path, client: FakeClient, sha: str) -> Path:
+    out = tmp_path / "out"
+    out.mkdir(exist_ok=True)
+    commit_info = CommitInfo("o/r", sha)
+    create_pymigbench_type_repo(commit_info, out, "gt-patch", client, use_delta=True)
+    return out / commit_info.folder_name
+
+
+def assert_gt_tree(repo_dir: Path, src: Path, sha: str):
+    assert git(repo_dir, "rev-parse", "gt-patch^{tree}") == git(src, "rev-parse", f"{sha}^{{tree}}")
+    assert git(repo_dir, "branch", "--format=%(refname:short)").split() == ["gt-patch", "main"]
+
+
+def test_added_modified_removed_and_renamed_files(tmp_path, src):
+    parent = commit(src, "p")
+    (src / "mod.py").write_text("new\n")
+    (src / "gone.py").unlink()
+    (src / "pkg" / "old_name.py").rename(src / "pkg" / "new_name.py")
+    (src / "added").mkdir()
+    (src / "added" / "new.py").write_text("added\n")
+    (src / "run.sh").write_text("#!/bin/sh\necho hi\n")
+    mig = commit(src, "m")
+    client = FakeClient(src)
+
+    repo_dir = build(tmp_path, client, mig)
+
+    assert_gt_tree(repo_dir, src, mig)
+    # Only the parent was downloaded in full
+    assert client.tarballs == [parent]
+    assert sorted(client.files) == ["added/new.py", "mod.py", "pkg/new_name.py", "run.sh"]
+
+
+def test_too_many_changed_files_downloads_in_full(tmp_path, src, monkeypatch):
+    monkeypatch.setattr(repo_mod, "DELTA_MAX_FILES", 1)
+    parent = commit(src, "p")
+    (src / "mod.py").write_text("new\n")
+    (src / "keep.py").write_text("changed\n")
+    mig = commit(src, "m")
+    client = FakeClient(src)
+
+    repo_dir = build(tmp_path, client, mig)
+
+    assert_gt_tree(repo_dir, src, mig)
+    assert client.files == []
+    assert sorted(client.tarballs) == sorted([parent, mig])
+
+
+def test_change_through_symlink_falls_back(tmp_path, src):
+    os.symlink("../outside.txt", src / "link")
+    os.symlink("..", src / "up")
+    parent = commit(src, "p")
+    (src / "link").unlink()
+    (src / "link").write_text("not a link anymore\n")
+    (src / "up").unlink()
+    (src / "up").mkdir()
+    (src / "up" / "outside.txt").write_text("through the link\n")
+    mig = commit(src, "m")
+    client = FakeClient(src)
+
+    repo_dir = build(tmp_path, client, mig)
+
+    assert_gt_tree(repo_dir, src, mig)
+    assert client.tarballs == [parent, mig]
+    # Nothing was written where the parent's links point
+    assert not (tmp_path / "out" / "outside.txt").exists()
+    assert not (tmp_path / "outside.txt").exists()
+
+
+def test_mode_change_falls_back(tmp_path, src):
+    parent = commit(src, "p")
+    os.chmod(src / "mod.py", 0o755)
+    mig = commit(src, "m")
+    client = FakeClient(src)
+
+    repo_dir = build(tmp_path, client, mig)
+
+    assert_gt_tree(repo_dir, src, mig)
+    assert client.files == ["mod.py"]
+    assert client.tarballs == [parent, mig]
+
+
+def test_tree_mismatch_deletes_branch_and_downloads_in_full(tmp_path, src, monkeypatch):
+    parent = commit(src, "p")
+    (src / "mod.py").write_text("new\n")
+    mig = commit(src, "m")
+    client = FakeClient(src)
+    client.tree_sha_override = "0" * 40
+    git_calls = []
+
+    def run_git(repo_dir, *args, **kwargs):
+        git_calls.append(args)
+        return git(repo_dir, *args)
+
+    monkeypatch.setattr(repo_mod, "run_git", run_git)
+
+    repo_dir = build(tmp_path, client, mig)
+
+    assert ("branch", "-D", "gt-patch") in git_calls
+    assert_gt_tree(repo_dir, src, mig)
+    assert client.files == ["mod.py"]
+    assert client.tarballs == [parent, mig]
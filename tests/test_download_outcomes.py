@@ -0,0 +1,41 @@
+from _fake_github import FakeClient, commit, git
+from pymigbench_dl import PyMigBenchDownloader
+from pymigbench_dl.providers.github.models import CommitInfo
+from pymigbench_dl.utils.ledger import CommitState
+
+
+class BrokenClient(FakeClient):
+    """Fails to serve the snapshot of `broken`."""
+
+    def __init__(self, src, broken: str):
+        super().__init__(src)
+        self.broken = broken
+
+    def _archive(self, sha: str) -> bytes:
+        if sha == self.broken:
+            raise OSError("connection reset")
+        return super()._archive(sha)
+
+
+def test_skipped_commits_are_not_counted_as_failed(tmp_path, caplog):
+    src = tmp_path / "src"
+    src.mkdir()
+    git(src, "init", "-q")
+    (src / "a.py").write_text("a\n")
+    root = commit(src, "root")
+    (src / "a.py").write_text("b\n")
+    ok = commit(src, "ok")
+    (src / "a.py").write_text("c\n")
+    broken = commit(src, "broken")
+
+    downloader = PyMigBenchDownloader(github_token="t", output_dir=str(tmp_path / "out"))
+    downloader.github_client = BrokenClient(src, broken)
+    commits = [CommitInfo("o/r", sha) for sha in (root, ok, broken)]
+
+    caplog.set_level("INFO", logger=downloader.logger.name)
+    assert downloader.download_commits(commits) == (1, 1, 1)
+    assert "Download complete: 1 successful, 1 skipped, 1 failed" in caplog.text
+    assert downloader.ledger.get(commits[0]) == CommitState.SKIPPED_NO_PARENT
+
+    # On a re-run, the commit the ledger settled is still counted as skipped
+    assert downloader.download_commits(commits) == (1, 1, 1)
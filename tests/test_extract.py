@@ -0,0 +1,132 @@
+import gzip
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from pymigbench_dl.utils import fs
+from pymigbench_dl.utils.fs import extract_tar_strip_top, safe_member_path
+
+BIG = os.urandom(fs.EXTRACT_MAX_QUEUED_SIZE + 1)
+
+
+def make_tar(members: list[tuple], gzipped: bool) -> io.BytesIO:
+    """
+    In-memory tarball of `members`, each (name, content) for a file, (name, content, mode), (name, None) for a dir
+    or (name, "->", target) for a symlink.
+    """
+    raw = io.BytesIO()
+    with tarfile.open(fileobj=raw, mode="w") as tf:
+        for name, content, *rest in members:
+            info = tarfile.TarInfo(name)
+            if content is None:
+                info.type, info.mode = tarfile.DIRTYPE, 0o755
+                tf.addfile(info)
+            elif content == "->":
+                info.type, info.linkname = tarfile.SYMTYPE, rest[0]
+                tf.addfile(info)
+            else:
+                info.size, info.mode = len(content), rest[0] if rest else 0o644
+                tf.addfile(info, io.BytesIO(content))
+    data = raw.getvalue()
+    return io.BytesIO(gzip.compress(data) if gzipped else data)
+
+
+def tree(root: Path) -> dict:
+    """Relative path -> file contents, symlink target, or None for a dir."""
+    out: dict = {}
+    for p in sorted(root.rglob("*")):
+        rel = p.relative_to(root).as_posix()
+        if p.is_symlink():
+            out[rel] = "-> " + os.readlink(p)
+        elif p.is_dir():
+            out[rel] = None
+        else:
+            out[rel] = p.read_bytes()
+    return out
+
+
+@pytest.fixture(params=["plain", "gzip", "gzip-zlib"])
+def gzipped(request, monkeypatch):
+    if request.param == "gzip-zlib":
+        # tarfile's own gzip stream, as without isal installed
+        monkeypatch.setattr(fs, "igzip", None)
+    return request.param != "plain"
+
+
+@pytest.fixture(params=[1, 4])
+def workers(request, monkeypatch):
+    monkeypatch.setattr(fs, "EXTRACT_MAX_WORKERS", request.param)
+    return request.param
+
+
+def test_extracts_tree_without_top_dir(tmp_path, gzipped, workers):
+    tar = make_tar([
+        ("repo-abc/", None),
+        ("repo-abc/README.md", b"readme\n"),
+        ("repo-abc/src/", None),
+        ("repo-abc/src/pkg/mod.py", b"x = 1\n"),
+        ("repo-abc/run.sh", b"#!/bin/sh\n", 0o755),
+        ("repo-abc/big.bin", BIG),
+        # Symlinks may point at members that come later in the archive
+        ("repo-abc/link", "->", "src/pkg/later.py"),
+        ("repo-abc/src/pkg/later.py", b"later\n"),
+    ], gzipped)
+
+    extract_tar_strip_top(tar, tmp_path)
+
+    assert tree(tmp_path) == {
+        "README.md": b"readme\n",
+        "big.bin": BIG,
+        "link": "-> src/pkg/later.py",
+        "run.sh": b"#!/bin/sh\n",
+        "src": None,
+        "src/pkg": None,
+        "src/pkg/later.py": b"later\n",
+        "src/pkg/mod.py": b"x = 1\n",
+    }
+    assert (tmp_path / "link").read_bytes() == b"later\n"
+    assert (tmp_path / "run.sh").stat().st_mode & 0o777 == 0o755
+    assert (tmp_path / "README.md").stat().st_mode & 0o777 == 0o644
+
+
+def test_files_without_dir_members(tmp_path, workers):
+    # `git archive` lists every dir, but other tarballs may not
+    tar = make_tar([("top/a/b/c.txt", b"c\n")], gzipped=True)
+    extract_tar_strip_top(tar, tmp_path)
+    assert tree(tmp_path) == {"a": None, "a/b": None, "a/b/c.txt": b"c\n"}
+
+
+@pytest.mark.parametrize("name", ["top/../x", "top/a/../../x", "top//x", "/x"])
+def test_member_outside_root_is_rejected(tmp_path, name):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    tar = make_tar([("top/", None), (name, b"evil\n")], gzipped=True)
+    with pytest.raises(RuntimeError):
+        extract_tar_strip_top(tar, dest)
+    assert not (tmp_path / "x").exists()
+
+
+def test_no_write_through_archive_symlink(tmp_path, workers):
+    dest = tmp_path / "dest"
+    outside = tmp_path / "outside"
+    dest.mkdir()
+    outside.mkdir()
+    tar = make_tar([("top/", None), ("top/link", "->", str(outside)), ("top/link/evil.txt", b"evil\n")], gzipped=True)
+    # The file is written to a real dir first, so the symlink can't be created over it afterwards
+    with pytest.raises(OSError):
+        extract_tar_strip_top(tar, dest)
+    assert list(outside.iterdir()) == []
+
+
+@pytest.mark.parametrize("name", ["a.txt", "a/b/c.txt", "a/..b", ".hidden"])
+def test_safe_member_path(tmp_path, name):
+    assert safe_member_path(tmp_path, name) == tmp_path / name
+
+
+@pytest.mark.parametrize("name", ["..", "../a", "a/../../b", "a/..", "/etc/passwd"])
+def test_safe_member_path_rejects_escapes(tmp_path, name):
+    with pytest.raises(RuntimeError):
+        safe_member_path(tmp_path, name)
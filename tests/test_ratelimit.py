@@ -0,0 +1,99 @@
+import types
+
+import pytest
+
+from pymigbench_dl.providers.github import ratelimit
+from pymigbench_dl.providers.github.ratelimit import GitHubRateLimiter
+
+
+class FakeClock:
+    """Stands in for the `time` module of ratelimit: `sleep` advances `now` instead of blocking."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(time=clock.time, sleep=clock.sleep))
+    return clock
+
+
+def headers(remaining: int, reset: float, resource: str | None = None) -> dict:
+    h = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+    if resource is not None:
+        h["X-RateLimit-Resource"] = resource
+    return h
+
+
+def test_unknown_budget_is_not_held_back(clock):
+    limiter = GitHubRateLimiter()
+    assert limiter.has_budget()
+    for _ in range(10):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+
+def test_acquire_takes_tokens_until_bucket_is_empty(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(2, clock.now + 60))
+    limiter.acquire()
+    assert limiter.has_budget()
+    limiter.acquire()
+    assert not limiter.has_budget()
+    assert clock.sleeps == []
+
+
+def test_empty_bucket_sleeps_until_reset(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(0, clock.now + 30))
+    limiter.acquire()
+    assert clock.sleeps == [30]
+    # The window rolled over, so the budget is unknown again
+    assert limiter.has_budget()
+
+
+def test_threshold_is_kept_in_reserve(clock):
+    limiter = GitHubRateLimiter(threshold=5)
+    limiter.update(headers(6, clock.now + 60))
+    limiter.acquire()
+    assert not limiter.has_budget()
+    limiter.acquire()
+    assert clock.sleeps == [60]
+
+
+def test_update_overwrites_bucket(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(0, clock.now + 60))
+    limiter.update(headers(100, clock.now + 60))
+    assert limiter.has_budget()
+
+
+def test_update_ignores_responses_without_headers(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(0, clock.now + 60))
+    limiter.update({})
+    assert not limiter.has_budget()
+
+
+def test_resources_have_separate_buckets(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(0, clock.now + 60), resource="graphql")
+    assert not limiter.has_budget("graphql")
+    assert limiter.has_budget("core")
+
+
+def test_resource_header_takes_precedence(clock):
+    limiter = GitHubRateLimiter()
+    limiter.update(headers(0, clock.now + 60, resource="search"))
+    assert not limiter.has_budget("search")
+    assert limiter.has_budget("core")
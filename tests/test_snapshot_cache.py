@@ -0,0 +1,132 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from _fake_github import FakeClient, commit, git
+from pymigbench_dl import PyMigBenchDownloader
+from pymigbench_dl.providers.github.models import CommitInfo
+from pymigbench_dl.utils import snapshots as snapshots_mod
+from pymigbench_dl.utils.repo import STAGING_DIR_PREFIX
+from pymigbench_dl.utils.snapshots import SnapshotCache
+
+COMMIT = CommitInfo("o/r", "a" * 40)
+
+
+class FakeFetch:
+    """Stands in for fetch_commit_tree, holding each fetch until `release` is set."""
+
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+        self.calls: list[CommitInfo] = []
+        self.release = threading.Event()
+
+    def __call__(self, commit, snapshots, extract_to: Path) -> Path:
+        self.calls.append(commit)
+        (extract_to / "partial.py").write_text("x\n")
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return extract_to
+
+
+def get_concurrently(cache: SnapshotCache, n: int, fetch: FakeFetch) -> list:
+    """Results of `n` concurrent `get`s of COMMIT (the tree or the exception), once all of them are waiting."""
+    results: list = [None] * n
+
+    def get(i):
+        try:
+            results[i] = cache.get(COMMIT)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    fetch.release.set()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SnapshotCache(tmp_path, snapshots=None)
+
+
+def test_shared_snapshot_is_fetched_once(cache, monkeypatch):
+    fetch = FakeFetch()
+    monkeypatch.setattr(snapshots_mod, "fetch_commit_tree", fetch)
+    for _ in range(3):
+        cache.retain(COMMIT)
+
+    trees = get_concurrently(cache, 3, fetch)
+
+    assert fetch.calls == [COMMIT]
+    assert len(set(trees)) == 1 and trees[0].is_dir()
+
+
+def test_tree_is_removed_after_last_release(cache, monkeypatch):
+    fetch = FakeFetch()
+    fetch.release.set()
+    monkeypatch.setattr(snapshots_mod, "fetch_commit_tree", fetch)
+    cache.retain(COMMIT)
+    cache.retain(COMMIT)
+    tree = cache.get(COMMIT)
+
+    cache.release(COMMIT)
+    assert tree.is_dir()
+    assert COMMIT in cache
+    cache.release(COMMIT)
+    assert not tree.exists()
+    assert COMMIT not in cache
+
+
+def test_failed_fetch_raises_for_every_user(cache, tmp_path, monkeypatch):
+    error = RuntimeError("broken tarball")
+    fetch = FakeFetch(error)
+    monkeypatch.setattr(snapshots_mod, "fetch_commit_tree", fetch)
+    for _ in range(3):
+        cache.retain(COMMIT)
+
+    results = get_concurrently(cache, 3, fetch)
+
+    assert results == [error] * 3
+    assert fetch.calls == [COMMIT]
+    # The partial tree is removed right away
+    assert list(tmp_path.iterdir()) == []
+    for _ in range(3):
+        cache.release(COMMIT)
+    assert COMMIT not in cache
+
+    # Nothing is left behind, so a later user fetches again
+    fetch.error = None
+    cache.retain(COMMIT)
+    assert cache.get(COMMIT).is_dir()
+    assert fetch.calls == [COMMIT, COMMIT]
+    cache.release(COMMIT)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_shared_parent_is_downloaded_once(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    git(src, "init", "-q")
+    (src / "a.py").write_text("a\n")
+    parent = commit(src, "p")
+    (src / "a.py").write_text("first\n")
+    first = commit(src, "m1")
+    git(src, "checkout", "-q", parent)
+    (src / "a.py").write_text("second\n")
+    second = commit(src, "m2")
+
+    downloader = PyMigBenchDownloader(github_token="t", output_dir=str(tmp_path / "out"), max_workers=2)
+    downloader.github_client = client = FakeClient(src)
+    commits = [CommitInfo("o/r", first), CommitInfo("o/r", second)]
+
+    assert downloader.download_commits(commits) == (2, 0, 0)
+    assert sorted(client.tarballs) == sorted([parent, first, second])
+    for c in commits:
+        assert git(tmp_path / "out" / c.folder_name, "rev-parse", "gt-patch^{tree}") == git(src, "rev-parse", f"{c.commit_sha}^{{tree}}")
+    # The workers' staging roots are gone with the pool
+    assert [p.name for p in (tmp_path / "out").iterdir() if p.name.startswith(STAGING_DIR_PREFIX)] == []